@@ -0,0 +1,77 @@
+"""
+Benchmark of dense and decomposed footprints for the morphology widgets.
+
+Compares erosions with dense footprints and with the decomposed footprints of
+napari_skimage._footprints, for grey scale and binary images, 2D and 3D footprints of
+increasing size, and reports the footprint selected automatically. Binary operations with
+disks and balls are also compared with the distance transform of
+napari_skimage._distance. Run with:
+
+    python benchmarks/benchmark_morphology.py
+"""
+import time
+import warnings
+
+import numpy as np
+import skimage.morphology as sm
+
+from napari_skimage._distance import (
+    DISTANCE_TRANSFORM_RADIUS,
+    distance_morphology,
+)
+from napari_skimage._footprints import (
+    APPROXIMATE_DECOMPOSITIONS,
+    DECOMPOSITIONS,
+    get_footprint,
+    make_footprint,
+)
+
+# approximate decompositions (balls) are timed as selected with approximate=True
+ALL_DECOMPOSITIONS = {**DECOMPOSITIONS, **APPROXIMATE_DECOMPOSITIONS}
+
+
+def timeit(func, *args, repeat=3, **kwargs):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    rng = np.random.default_rng(0)
+    warnings.simplefilter('ignore')
+    image_2d = rng.integers(0, 2**8, (512, 512)).astype(np.uint8)
+    image_3d = rng.integers(0, 2**8, (48, 128, 128)).astype(np.uint8)
+    cases = [
+        ('2D grey', sm.erosion, image_2d, False, 'disk', [1, 2, 3, 5, 8, 15, 30]),
+        ('2D grey', sm.erosion, image_2d, False, 'diamond', [2, 5, 10, 20]),
+        ('2D binary', sm.binary_erosion, image_2d > 80, True, 'disk', [3, 10, 20, 30]),
+        ('3D grey', sm.erosion, image_3d, False, 'ball', [1, 2, 3, 5, 8]),
+        ('3D binary', sm.binary_erosion, image_3d > 80, True, 'ball', [2, 5, 10, 15]),
+    ]
+    print(f'{"image":>10} {"footprint":>9} {"size":>5} {"elements":>8} {"dense":>9} {"decomposed":>10}  auto')
+    for name, func, image, binary, shape, sizes in cases:
+        for size in sizes:
+            dense_footprint = make_footprint(shape, size)
+            dense = timeit(func, image, dense_footprint)
+            decomposed = timeit(func, image, make_footprint(shape, size, ALL_DECOMPOSITIONS[shape]))
+            auto = 'decomposed' if isinstance(get_footprint(shape, size, binary=binary, approximate=True), tuple) else 'dense'
+            best = 'decomposed' if decomposed < dense else 'dense'
+            print(f'{name:>10} {shape:>9} {size:>5} {np.count_nonzero(dense_footprint):>8} '
+                  f'{dense:>8.3f}s {decomposed:>9.3f}s  {auto}{"" if auto == best else " (slower)"}')
+
+    print(f'\n{"image":>10} {"footprint":>9} {"radius":>6} {"dense":>9} {"decomposed":>10} {"distance":>9}  auto')
+    for name, image, shape, radii in [('2D binary', image_2d > 80, 'disk', [2, 3, 5, 10, 30, 50]),
+                                      ('3D binary', image_3d > 80, 'ball', [2, 3, 5, 10, 15])]:
+        for radius in radii:
+            dense = timeit(sm.binary_closing, image, make_footprint(shape, radius), repeat=1)
+            decomposed = timeit(sm.binary_closing, image, make_footprint(shape, radius, ALL_DECOMPOSITIONS[shape]))
+            distance = timeit(distance_morphology, 'closing', image, radius)
+            auto = 'distance' if radius >= DISTANCE_TRANSFORM_RADIUS else 'footprint'
+            print(f'{name:>10} {shape:>9} {radius:>6} {dense:>8.3f}s {decomposed:>9.3f}s {distance:>8.3f}s  {auto}')
+
+
+if __name__ == '__main__':
+    main()
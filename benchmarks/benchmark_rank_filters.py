@@ -0,0 +1,51 @@
+"""
+Benchmark of the median filter engines of napari_skimage._rank.
+
+Compares skimage.filters.median (sorting) with the sliding histogram engine for disk
+footprints of increasing size and images of increasing bit depth, and reports the
+engine selected automatically. Run with:
+
+    python benchmarks/benchmark_rank_filters.py
+"""
+import time
+import warnings
+
+import numpy as np
+import skimage.filters as sf
+import skimage.morphology as sm
+
+from napari_skimage._rank import histogram_median, use_histogram
+
+
+def timeit(func, *args, repeat=3, **kwargs):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    rng = np.random.default_rng(0)
+    warnings.simplefilter('ignore')
+    cases = [
+        ('2D uint8', rng.integers(0, 2**8, (512, 512)).astype(np.uint8), sm.disk, [1, 2, 3, 5, 8, 12, 20, 30]),
+        ('2D 12 bit', rng.integers(0, 2**12, (512, 512)).astype(np.uint16), sm.disk, [1, 3, 5, 8, 12, 20, 30]),
+        ('2D 16 bit', rng.integers(0, 2**16, (256, 256)).astype(np.uint16), sm.disk, [3, 12, 30, 50]),
+        ('3D uint8', rng.integers(0, 2**8, (64, 128, 128)).astype(np.uint8), sm.ball, [1, 2, 3, 5]),
+    ]
+    print(f'{"image":>10} {"radius":>6} {"size":>6} {"sorting":>9} {"histogram":>9}  auto')
+    for name, image, footprint_func, radii in cases:
+        for radius in radii:
+            footprint = footprint_func(radius)
+            sorting = timeit(sf.median, image, footprint=footprint)
+            histogram = timeit(histogram_median, image, footprint)
+            auto = 'histogram' if use_histogram(image, footprint) else 'sorting'
+            best = 'histogram' if histogram < sorting else 'sorting'
+            print(f'{name:>10} {radius:>6} {np.count_nonzero(footprint):>6} '
+                  f'{sorting:>8.3f}s {histogram:>8.3f}s  {auto}{"" if auto == best else " (slower)"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Cache of widget results. Results are keyed by a fingerprint of the input data and of
+the function called with its parameters, so that re-applying a widget with the same
+inputs (or toggling between a few parameter sets) returns the stored result instead of
+recomputing it. The least recently used results are evicted when the total size of the
+cache exceeds its memory budget, which defaults to 1 GB and can be set with the
+NAPARI_SKIMAGE_CACHE_MB environment variable or via result_cache.max_bytes.
+Inputs larger than the budget are not fingerprinted, as their results could not be stored.
+Stored arrays are made read-only, as they are shared by all the layers created from them.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import partial
+
+import numpy as np
+
+
+def fingerprint(data):
+    """Hash of the content, shape and dtype of a numpy array."""
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(repr((data.shape, data.dtype.str)).encode())
+    hasher.update(np.ascontiguousarray(data))
+    return hasher.hexdigest()
+
+
+def _describe(value):
+    """Text description of a parameter value, or None if it cannot be described."""
+    if isinstance(value, partial):
+        args = [_describe(a) for a in value.args]
+        kwargs = [(k, _describe(v)) for k, v in sorted(value.keywords.items())]
+        func = _describe(value.func)
+        if func is None or None in args or None in [v for _, v in kwargs]:
+            return None
+        return f'partial({func}, {args}, {kwargs})'
+    if isinstance(value, np.ndarray):
+        return f'array({fingerprint(value)})'
+    if callable(value):
+        name = f'{getattr(value, "__module__", "")}.{getattr(value, "__qualname__", "")}'
+        # lambdas and local functions cannot be told apart by their name
+        return None if '<' in name else name
+    return repr(value)
+
+
+def make_key(func, data, **options):
+    """Cache key of func applied to data with options, or None if not cacheable."""
+    if not isinstance(data, np.ndarray):
+        return None
+    func_description = _describe(func)
+    if func_description is None:
+        return None
+    return (fingerprint(data), func_description, repr(sorted(options.items())))
+
+
+class ResultCache:
+    """Least recently used cache of arrays bounded by a memory budget in bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def fits(self, nbytes):
+        """Whether an array of nbytes bytes can be stored in the cache."""
+        return nbytes <= self.max_bytes
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        """Store value under key, making it read-only."""
+        if key is None or not isinstance(value, np.ndarray) or not self.fits(value.nbytes):
+            return
+        # changes to the data of a layer would otherwise change later results
+        value.flags.writeable = False
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key).nbytes
+            self._entries[key] = value
+            self.nbytes += value.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+
+result_cache = ResultCache(
+    max_bytes=int(os.environ.get('NAPARI_SKIMAGE_CACHE_MB', 1024)) * 2**20)
@@ -0,0 +1,147 @@
+"""
+Binary morphology by disks and balls computed from Euclidean distance transforms. A pixel
+belongs to the dilation of a mask by a disk of radius r if its distance to the mask is at
+most r, and to the erosion if its distance to the background is more than r. This gives
+exactly the results of skimage.morphology with disk and ball footprints, in a time that
+does not depend on the radius, so that it is much faster than the dense footprints for
+large radii. Distances can be computed in physical units (sampling), so that the footprint
+is a sphere in space for anisotropic voxels instead of a ball in pixels.
+"""
+
+import numpy as np
+import scipy.ndimage as ndi
+
+# radius from which the distance transform is faster than the footprints
+DISTANCE_TRANSFORM_RADIUS = 5
+
+
+def pixel_sampling(scale):
+    """Sampling of each axis relative to the finest one, None if isotropic."""
+    scale = np.asarray(scale, dtype=float)
+    if np.all(scale == scale[0]):
+        return None
+    return tuple(scale / scale.min())
+
+
+def _erode(mask, radius, sampling=None):
+    if mask.all():
+        # the distance transform is not defined without background
+        return mask.copy()
+    return ndi.distance_transform_edt(mask, sampling=sampling) > radius
+
+
+def _dilate(mask, radius, sampling=None):
+    if not mask.any():
+        return mask.copy()
+    return ndi.distance_transform_edt(~mask, sampling=sampling) <= radius
+
+
+def distance_morphology(method, mask, radius, sampling=None):
+    """Binary erosion, dilation, opening or closing of mask by a disk or ball.
+
+    radius is given in pixels of the finest axis of sampling.
+    """
+    mask = np.asarray(mask).astype(bool)
+    if method == 'erosion':
+        return _erode(mask, radius, sampling)
+    if method == 'dilation':
+        return _dilate(mask, radius, sampling)
+    if method == 'opening':
+        return _dilate(_erode(mask, radius, sampling), radius, sampling)
+    if method == 'closing':
+        return _erode(_dilate(mask, radius, sampling), radius, sampling)
+    raise ValueError(f'Unknown method {method}')
+
+
+def _shifted(offset, shape):
+    """Slices of the pixels and of their neighbours at the given offset."""
+    first = tuple(slice(0, s - o) if o > 0 else slice(-o, None) for s, o in zip(shape, offset))
+    second = tuple(slice(o, None) if o > 0 else slice(0, s + o) for s, o in zip(shape, offset))
+    return first, second
+
+
+def label_adjacency(index, n):
+    """Pairs (i, j) of touching labels, also diagonally, given consecutive label indices.
+
+    index is the image of label indices (0 for the background) and n their
+    number. Each pair is given in both orders.
+    """
+    keys = []
+    for offset in np.ndindex((3,) * index.ndim):
+        offset = np.array(offset) - 1
+        # each pair of neighbours is visited once, from its first pixel in raster order
+        nonzero = np.flatnonzero(offset)
+        if nonzero.size == 0 or offset[nonzero[0]] < 0:
+            continue
+        first, second = _shifted(offset, index.shape)
+        first, second = index[first], index[second]
+        touching = (first != second) & (first != 0) & (second != 0)
+        first, second = first[touching].astype(np.int64), second[touching].astype(np.int64)
+        keys.append(np.concatenate([first * n + second, second * n + first]))
+    keys = np.unique(np.concatenate(keys))
+    return keys // n, keys % n
+
+
+def color_labels(labels):
+    """Image of colors (1, 2, ...) such that touching labels have different colors.
+
+    Colors are assigned greedily from the adjacency graph of the labels, so
+    that their number stays small (typically below 10) for any number of labels.
+    """
+    ids, index = np.unique(labels, return_inverse=True)
+    index = index.reshape(labels.shape)
+    if ids[0] != 0:
+        # index 0 is reserved for the background
+        ids, index = np.concatenate([[0], ids]), index + 1
+    first, second = label_adjacency(index, len(ids))
+    starts = np.searchsorted(first, np.arange(len(ids) + 1))
+    colors = np.zeros(len(ids), dtype=np.int64)
+    for i in range(1, len(ids)):
+        used = set(colors[second[starts[i]:starts[i + 1]]].tolist())
+        color = 1
+        while color in used:
+            color += 1
+        colors[i] = color
+    return colors[index]
+
+
+def erode_labels(labels, radius, sampling=None):
+    """Erosion of each label by a disk or ball, keeping label values.
+
+    Labels of the same color do not touch, so the distance of a pixel to
+    the nearest pixel of another label or of the background is given by
+    one distance transform per color.
+    """
+    colors = color_labels(labels)
+    keep = np.zeros(labels.shape, dtype=bool)
+    for color in range(1, colors.max() + 1):
+        keep |= _erode(colors == color, radius, sampling)
+    return np.where(keep, labels, 0).astype(labels.dtype)
+
+
+def dilate_labels(labels, radius, sampling=None):
+    """Dilation of each label by a disk or ball, assigning contested pixels to the nearest label."""
+    if not labels.any():
+        return labels.copy()
+    distance, indices = ndi.distance_transform_edt(labels == 0, sampling=sampling, return_indices=True)
+    return np.where(distance <= radius, labels[tuple(indices)], 0).astype(labels.dtype)
+
+
+def label_morphology(method, labels, radius, sampling=None):
+    """Erosion, dilation, opening or closing of each label of labels by a disk or ball.
+
+    Labels keep their values and do not overlap: dilated labels stop where
+    they meet and the closing of a label only adds pixels of the background.
+    """
+    labels = np.asarray(labels)
+    if method == 'erosion':
+        return erode_labels(labels, radius, sampling)
+    if method == 'dilation':
+        return dilate_labels(labels, radius, sampling)
+    if method == 'opening':
+        # pixels of a label are too far from the eroded neighbours to be claimed by them
+        return dilate_labels(erode_labels(labels, radius, sampling), radius, sampling)
+    if method == 'closing':
+        closed = erode_labels(dilate_labels(labels, radius, sampling), radius, sampling)
+        return np.where(labels != 0, labels, closed)
+    raise ValueError(f'Unknown method {method}')
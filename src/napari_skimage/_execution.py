@@ -0,0 +1,314 @@
+"""
+Shared execution layer for the processing widgets. Computations are wrapped in a
+generator that yields once per processed plane, run in a napari thread worker
+(which displays a progress bar in the activity dock) and can be cancelled between
+two planes. When the computation is done, the worker returns a LayerDataTuple so
+that magic_factory widgets can be annotated with FunctionWorker[LayerDataTuple].
+Filters on lazy (dask, zarr) layers that provide a halo size are instead applied
+tile by tile and return a lazy array (see _tiling). Finally, when an axis is chosen
+with the "Process along axis" option, each frame along that axis is processed
+independently in a process pool and written into a preallocated output.
+Image results computed in memory are stored in a cache keyed by the input data and
+the parameters so that repeated requests are served without recomputing (see _cache).
+When called for a preview (see _preview), only the visible region of the data is processed.
+The precision of floating point results is set with with_precision: data are converted
+plane by plane (or tile by tile) so that e.g. a uint16 stack is never promoted to float64
+as a whole when a float32 result is requested.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import partial
+
+import numpy as np
+import skimage.util
+from magicgui.widgets import Button
+from napari.qt.threading import create_worker
+from qtpy.QtCore import QTimer
+
+from ._cache import make_key, result_cache
+from ._preview import compute_preview, get_preview_region, preview_slices
+from ._tiling import apply_planes, is_lazy, map_tiles
+
+PROCESS_AXIS = {'label': 'Process along axis', 'widget_type': 'ComboBox',
+                'choices': [('none', None)], 'nullable': False}
+
+PRECISION = {'label': 'Precision', 'choices': ['auto', 'float32', 'float64']}
+
+# with the 'auto' precision, inputs with more elements than this give float32 results
+LARGE_DATA_SIZE = 2**25
+
+_process_pool = None
+
+
+def get_process_pool():
+    """Return the process pool shared by all widgets, creating it if needed."""
+    global _process_pool
+    if _process_pool is None:
+        # spawn rather than fork, as forking a multi-threaded Qt application is unsafe
+        _process_pool = ProcessPoolExecutor(
+            mp_context=multiprocessing.get_context('spawn'))
+    return _process_pool
+
+
+def n_planes(data, plane_ndim=None):
+    """Number of planes of dimension plane_ndim contained in data."""
+    if plane_ndim is None or data.ndim <= plane_ndim:
+        return 1
+    return int(np.prod(data.shape[:data.ndim - plane_ndim]))
+
+
+def _as_tuple(result):
+    """Results of functions returning one or several arrays as a tuple."""
+    return result if isinstance(result, tuple) else (result,)
+
+
+def map_planes(func, data, plane_ndim=None):
+    """Apply func to each plane of the trailing plane_ndim axes of data.
+
+    This is a generator yielding the index of each processed plane and returning
+    the stacked result. If plane_ndim is None or matches the data dimensions,
+    func is applied once to the full array. If func returns a tuple of arrays,
+    a tuple of stacked arrays is returned.
+    """
+    if plane_ndim is None or data.ndim <= plane_ndim:
+        out = func(data)
+        yield ()
+        return out
+
+    leading_shape = data.shape[:data.ndim - plane_ndim]
+    out = None
+    for index in np.ndindex(leading_shape):
+        plane = func(np.asarray(data[index]))
+        if out is None:
+            out = [np.empty(leading_shape + p.shape, dtype=p.dtype) for p in _as_tuple(plane)]
+        for o, p in zip(out, _as_tuple(plane)):
+            o[index] = p
+        yield index
+    return tuple(out) if isinstance(plane, tuple) else out[0]
+
+
+def map_frames(func, data, axis, plane_ndim=None):
+    """Apply func independently to each frame of data along axis in the process pool.
+
+    This is a generator yielding the index of each processed frame, in order of
+    completion, and returning the output array in which frames are written as
+    they arrive. The number of frames in flight is bounded so that lazy data are
+    only loaded a few frames at a time. func needs to be picklable.
+    """
+    if plane_ndim is not None and data.ndim - 1 > plane_ndim:
+        func = partial(apply_planes, func, plane_ndim=plane_ndim)
+
+    pool = get_process_pool()
+    n_frames = data.shape[axis]
+    max_pending = 2 * (os.cpu_count() or 1)
+    frames = iter(range(n_frames))
+    pending = {}
+
+    def submit(i):
+        frame = np.asarray(data[(slice(None),) * axis + (i,)])
+        pending[pool.submit(func, frame)] = i
+
+    out = None
+    try:
+        for i in frames:
+            submit(i)
+            if len(pending) == max_pending:
+                break
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = pending.pop(future)
+                frame = future.result()
+                # outputs with fewer dimensions (e.g. one value per frame) get the frame axis last
+                if out is None:
+                    out = [np.empty(f.shape[:axis] + (n_frames,) + f.shape[axis:], dtype=f.dtype)
+                           for f in _as_tuple(frame)]
+                for o, f in zip(out, _as_tuple(frame)):
+                    o[(slice(None),) * min(axis, f.ndim) + (i,)] = f
+                next_frame = next(frames, None)
+                if next_frame is not None:
+                    submit(next_frame)
+                yield i
+    finally:
+        # on cancellation, drop the frames that did not start yet
+        for future in pending:
+            future.cancel()
+    if out is None:
+        return None
+    return tuple(out) if isinstance(frame, tuple) else out[0]
+
+
+def float_dtype(data, precision='auto'):
+    """Floating point dtype of the result of processing data with the given precision.
+
+    With 'auto', results are float32 for float32 inputs and for large inputs, and
+    float64 otherwise as with the skimage defaults.
+    """
+    if precision == 'auto':
+        large = data.size >= LARGE_DATA_SIZE
+        return 'float32' if large or data.dtype == np.float32 else 'float64'
+    return precision
+
+
+def apply_precision(func, data, dtype, rescale=False):
+    """Apply func to data converted to dtype and return floating point results as dtype.
+
+    If rescale is True, integer data are rescaled to [0, 1] (or [-1, 1]) as done
+    by skimage.util.img_as_float, otherwise their values are kept.
+    """
+    if rescale:
+        data = skimage.util.img_as_float32(data) if dtype == 'float32' else skimage.util.img_as_float64(data)
+    else:
+        data = np.asarray(data).astype(dtype, copy=False)
+    out = func(data)
+    if isinstance(out, tuple):
+        return tuple(_as_float(o, dtype) for o in out)
+    return _as_float(out, dtype)
+
+
+def _as_float(out, dtype):
+    if np.issubdtype(out.dtype, np.floating):
+        out = out.astype(dtype, copy=False)
+    return out
+
+
+def with_precision(func, data, precision='auto', rescale=False):
+    """Wrap func so that it computes and returns results with the given precision on data."""
+    return partial(apply_precision, func, dtype=float_dtype(data, precision), rescale=rescale)
+
+
+def compute_layer_data(func, data, layer_kwargs, layer_type='image', plane_ndim=None,
+                       axis=None, metadata_key=None):
+    """Generator running func over data plane by plane and returning a LayerDataTuple."""
+    # only images are cached as labels outputs can be edited in place by painting,
+    # inputs too large for the cache are not hashed
+    key = None
+    if layer_type == 'image' and result_cache.fits(getattr(data, 'nbytes', 0)):
+        key = make_key(func, data, plane_ndim=plane_ndim, axis=axis)
+    out = result_cache.get(key)
+    if out is not None:
+        yield ()
+        return (out, layer_kwargs, layer_type)
+
+    if axis is not None:
+        out = yield from map_frames(func, data, axis, plane_ndim)
+    else:
+        out = yield from map_planes(func, data, plane_ndim)
+    result_cache.put(key, out)
+    if metadata_key is not None:
+        out, values = out
+        layer_kwargs = {**layer_kwargs, 'metadata': {metadata_key: values}}
+    if isinstance(out, tuple):
+        return [(o, kwargs, layer_type) for o, kwargs in zip(out, layer_kwargs)]
+    return (out, layer_kwargs, layer_type)
+
+
+def run_in_worker(func, data, layer_kwargs, layer_type='image', plane_ndim=None,
+                  depth=None, axis=None, metadata_key=None, connect=None, boundary='none'):
+    """Run func on data in a background thread and return the worker.
+
+    The worker reports per-plane progress and returns a LayerDataTuple. It is
+    started on the next iteration of the event loop so that the caller (e.g.
+    magicgui) has time to connect to its signals before any result is emitted.
+
+    Parameters
+    ----------
+    func : callable
+        Function taking an array and returning the processed array, or a tuple
+        of arrays if it has several outputs.
+    data : array-like
+        Data to process.
+    layer_kwargs : dict or list of dict
+        Layer attributes of the result, e.g. {'name': ...}, or of each result
+        if func has several outputs. The worker then returns a list of
+        LayerDataTuple.
+    layer_type : str
+        Type of the output layer.
+    plane_ndim : int, optional
+        If given, func is applied independently to each plane made of the last
+        plane_ndim axes of data.
+    depth : int or tuple of int, optional
+        Halo size needed by func. If given and data is lazy, func is applied
+        lazily to overlapping tiles instead of the full array. It is also used
+        to crop the data around the region of a preview.
+    axis : int, optional
+        If given, func is applied independently to each frame along axis in a
+        process pool (see map_frames).
+    metadata_key : str, optional
+        If given, func returns the processed array and an array of values
+        (e.g. the threshold of each frame) stored in the metadata of the
+        layer under metadata_key.
+    connect : dict, optional
+        Mapping of worker signal names to callbacks.
+    boundary : str
+        Boundary of the tiles of lazy data, 'periodic' for filters wrapping
+        around the edges of the image (see _tiling.tile_boundary).
+
+    Returns
+    -------
+    worker : GeneratorWorker
+    """
+    region = get_preview_region()
+    if region is not None:
+        outer, inner = preview_slices(data.shape, region, depth, plane_ndim, axis)
+        data = np.asarray(data[outer])
+        func = partial(compute_preview, func, inner=inner, plane_ndim=plane_ndim, axis=axis)
+        plane_ndim = axis = None
+
+    if axis is not None:
+        total = data.shape[axis]
+    else:
+        if depth is not None and is_lazy(data):
+            func = partial(map_tiles, func, depth=depth, plane_ndim=plane_ndim, boundary=boundary)
+            plane_ndim = None
+        total = n_planes(data, plane_ndim)
+    name = (layer_kwargs[0] if isinstance(layer_kwargs, list) else layer_kwargs).get('name')
+    worker = create_worker(
+        compute_layer_data, func, data, layer_kwargs,
+        layer_type=layer_type, plane_ndim=plane_ndim, axis=axis, metadata_key=metadata_key,
+        _start_thread=False,
+        _progress=None if region is not None else {
+            'total': total if total > 1 else 0, 'desc': name},
+    )
+    for signal, callback in (connect or {}).items():
+        getattr(worker, signal).connect(callback)
+    QTimer.singleShot(0, worker.start)
+    return worker
+
+
+def _cancel(widget, event=None):
+    worker = getattr(widget, '_worker', None)
+    if worker is not None:
+        worker.quit()
+
+
+def _store_worker(widget, worker):
+    widget._worker = worker
+    widget.cancel_button.enabled = True
+    worker.finished.connect(partial(setattr, widget.cancel_button, 'enabled', False))
+
+
+def axis_choices(ndim):
+    """Choices of the "Process along axis" option: any axis but the last two."""
+    return [('none', None)] + [(str(i), i) for i in range(ndim - 2)]
+
+
+def connect_axis_choices(layer_widget, axis_widget):
+    """Update the axis choices of axis_widget when the layer of layer_widget changes."""
+    def update_axis_choices(event=None):
+        layer = layer_widget.value
+        axis_widget.choices = axis_choices(layer.data.ndim if layer is not None else 2)
+
+    layer_widget.changed.connect(update_axis_choices)
+    update_axis_choices()
+
+
+def add_cancel_button(widget):
+    """Add a button cancelling the last worker started by a magic_factory widget."""
+    widget._worker = None
+    widget.cancel_button = Button(text='Cancel', enabled=False)
+    widget.cancel_button.clicked.connect(partial(_cancel, widget))
+    widget.called.connect(partial(_store_worker, widget))
+    widget.extend([widget.cancel_button])
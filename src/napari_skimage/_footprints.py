@@ -0,0 +1,79 @@
+"""
+Footprints of the morphology widgets. Footprints are cached, so that they are generated
+once per shape and size instead of at each call. Large footprints are decomposed into
+sequences of small footprints (see the decomposition argument of skimage.morphology
+footprints): eroding by each small footprint in turn is equivalent to eroding by the
+large one but much faster, e.g. the binary erosion of a 48x128x128 stack by a ball of
+radius 15 goes from 7 s to 0.05 s. The decompositions give the same results as the
+dense footprints, except for balls for which skimage only gives a close approximation:
+balls are therefore only decomposed on request (approximate=True). Dense footprints
+remain faster below a size that was measured with
+benchmarks/benchmark_morphology.py, and for squares and cubes which scipy already
+applies separably.
+"""
+
+import functools
+
+import numpy as np
+import skimage.morphology as sm
+
+DECOMPOSITIONS = {
+    'disk': 'crosses',
+    'diamond': 'sequence',
+    'octagon': 'sequence',
+}
+# decompositions which only approximate the footprint
+APPROXIMATE_DECOMPOSITIONS = {
+    'ball': 'sequence',
+}
+# number of footprint elements above which the decomposition is faster
+LARGE_FOOTPRINT_SIZE = 25
+LARGE_BINARY_FOOTPRINT_SIZE = 1000
+
+
+@functools.lru_cache(maxsize=32)
+def make_footprint(shape, size, decomposition=None):
+    """Footprint of the given shape (e.g. 'disk') and size, optionally decomposed.
+
+    The footprint is cached and therefore read-only.
+    """
+    if shape in ('square', 'cube') and hasattr(sm, 'footprint_rectangle'):
+        footprint = sm.footprint_rectangle((size,) * (2 if shape == 'square' else 3),
+                                           decomposition=decomposition)
+    elif shape in ('square', 'cube'):
+        # scikit-image < 0.25 (e.g. on Python 3.9)
+        footprint = getattr(sm, shape)(size, decomposition=decomposition)
+    elif shape == 'octagon':
+        footprint = sm.octagon(size, size, decomposition=decomposition)
+    elif shape == 'star':
+        footprint = sm.star(size)
+    else:
+        footprint = getattr(sm, shape)(size, decomposition=decomposition)
+    for array in _arrays(footprint):
+        array.flags.writeable = False
+    return footprint
+
+
+def _arrays(footprint):
+    if isinstance(footprint, tuple):
+        return [array for array, _ in footprint]
+    return [footprint]
+
+
+def footprint_ndim(footprint):
+    """Number of dimensions of a dense or decomposed footprint."""
+    return _arrays(footprint)[0].ndim
+
+
+def get_footprint(shape, size, decompose=True, binary=False, approximate=False):
+    """Footprint of the given shape and size, decomposed if this is faster.
+
+    Footprints whose decomposition is approximate (balls) are only decomposed
+    if approximate is True.
+    """
+    footprint = make_footprint(shape, size)
+    decompositions = {**DECOMPOSITIONS, **APPROXIMATE_DECOMPOSITIONS} if approximate else DECOMPOSITIONS
+    large = LARGE_BINARY_FOOTPRINT_SIZE if binary else LARGE_FOOTPRINT_SIZE
+    if decompose and shape in decompositions and np.count_nonzero(footprint) > large:
+        return make_footprint(shape, size, decompositions[shape])
+    return footprint
@@ -0,0 +1,84 @@
+"""
+Global thresholds of lazy (dask, zarr) arrays. Instead of loading the full array, a
+histogram is accumulated chunk by chunk and the threshold is computed from it, as
+skimage does internally. Integer images with up to 16 bits are histogrammed over their
+full type range in a single read pass, which gives exactly the skimage thresholds; other
+images first need a pass to find their range. The histogram can be computed from a
+random sample of the chunks only, which gives an approximate threshold faster.
+"""
+
+import dask.array as da
+import numpy as np
+import skimage.filters as sf
+
+from ._tiling import as_dask
+
+
+def sample_chunks(data, fraction=1.0, seed=0):
+    """Flattened values of a random fraction of the chunks of a dask array."""
+    if fraction >= 1:
+        return data.ravel()
+    blocks = list(np.ndindex(data.numblocks))
+    n_blocks = max(1, int(round(fraction * len(blocks))))
+    chosen = np.random.default_rng(seed).choice(len(blocks), n_blocks, replace=False)
+    return da.concatenate([data.blocks[blocks[i]].ravel() for i in sorted(chosen)])
+
+
+def streaming_histogram(data, nbins=256, fraction=1.0, value_range=None):
+    """Histogram counts and bin centers of data as given by skimage.exposure.histogram.
+
+    Integer data have one bin per value between their minimum and maximum,
+    other data nbins bins between the bounds of value_range if given, or else
+    their minimum and maximum.
+    """
+    values = sample_chunks(as_dask(data), fraction)
+    if values.dtype.kind in 'iu':
+        info = np.iinfo(values.dtype)
+        if values.dtype.itemsize <= 2:
+            low, high = int(info.min), int(info.max)
+        else:
+            low, high = (int(v) for v in da.compute(values.min(), values.max()))
+        counts = da.bincount((values.astype(np.int64) - low), minlength=high - low + 1).compute()
+        nonzero = np.flatnonzero(counts)
+        counts = counts[nonzero[0]:nonzero[-1] + 1]
+        return counts, np.arange(low + nonzero[0], low + nonzero[-1] + 1)
+    if value_range is None:
+        value_range = da.compute(da.nanmin(values), da.nanmax(values))
+    low, high = (float(v) for v in value_range)
+    counts, edges = da.histogram(values, bins=nbins, range=(low, high))
+    counts = counts.compute()
+    return counts, (edges[:-1] + edges[1:]) / 2
+
+
+def threshold_li_histogram(counts, centers, tolerance=None):
+    """Li threshold from a histogram, as computed by skimage.filters.threshold_li."""
+    nonzero = counts > 0
+    counts, centers = counts[nonzero].astype(np.float32), centers[nonzero]
+    if len(centers) == 1:
+        return centers[0]
+    low = centers[0]
+    centers = centers - low
+    if tolerance is None:
+        tolerance = 0.5 if centers.dtype.kind in 'iu' else np.min(np.diff(centers)) / 2
+    t_next = np.average(centers, weights=counts)
+    t_curr = -2 * tolerance
+    while abs(t_next - t_curr) > tolerance:
+        t_curr = t_next
+        foreground = centers > t_curr
+        mean_fore = np.average(centers[foreground], weights=counts[foreground])
+        mean_back = np.average(centers[~foreground], weights=counts[~foreground])
+        if mean_back == 0:
+            break
+        t_next = (mean_back - mean_fore) / (np.log(mean_back) - np.log(mean_fore))
+    return t_next + low
+
+
+def histogram_threshold(data, method, nbins=256, fraction=1.0):
+    """Global threshold (otsu, li, yen or mean) of a lazy array computed chunk by chunk."""
+    if method == 'mean':
+        return float(sample_chunks(as_dask(data), fraction).mean().compute())
+    if method == 'li':
+        # Li's threshold is computed from values, finer bins approximate them better
+        return threshold_li_histogram(*streaming_histogram(data, nbins=max(nbins, 2**16), fraction=fraction))
+    hist = streaming_histogram(data, nbins=nbins, fraction=fraction)
+    return getattr(sf, f'threshold_{method}')(hist=hist)
@@ -0,0 +1,84 @@
+"""
+Tracking of the labels edited (painted, erased, filled) in a labels layer, so that only
+their region properties need to be recomputed. Each edit is recorded by napari in the
+undo history and emitted with the paint event, giving the painted region and the labels
+it had before and after. Other changes (replacing the data of the layer or of the
+intensity layer, undo and redo, which emit no paint event) cannot be tracked and
+invalidate the edits, so that all properties are recomputed.
+"""
+
+import numpy as np
+
+
+def _atom_edit(atom, shape):
+    """Labels changed by an edit of the undo history and bounding box (start, stop) of the edit.
+
+    The bounding box is None if the edit changed no pixel.
+    """
+    if hasattr(atom, 'slice_key'):
+        # edit of a masked region (paint, fill, polygon)
+        bounds = [s.indices(size)[:2] for s, size in zip(atom.slice_key, shape)]
+        labels = np.union1d(np.unique(atom.old_values), [atom.new_value])
+    else:
+        # pixels set by data_setitem: (indices, old values, new values)
+        indices, old_values, new_values = atom
+        indices = [np.asarray(axis_indices).ravel() for axis_indices in indices]
+        if indices[0].size == 0:
+            return np.empty(0, dtype=np.int64), None
+        bounds = [(int(i.min()), int(i.max()) + 1) for i in indices]
+        labels = np.union1d(np.unique(old_values), np.unique(new_values))
+    return labels, np.array(bounds).T
+
+
+class LabelEdits:
+    """Labels edited in a labels layer since the last reset, with the bounding boxes of their edits."""
+
+    def __init__(self, layer, image_layer=None):
+        self.layer = layer
+        self.image_layer = image_layer
+        self.reset()
+        layer.events.paint.connect(self._on_paint)
+        layer.events.set_data.connect(self._on_set_data)
+        layer.events.data.connect(self.invalidate)
+        if image_layer is not None:
+            image_layer.events.data.connect(self.invalidate)
+
+    def reset(self):
+        # label: (start, stop) of the bounding box of its edits
+        self.boxes = {}
+        self.valid = True
+        self._history = self._history_length()
+
+    def invalidate(self, event=None):
+        self.valid = False
+
+    def disconnect(self):
+        self.layer.events.paint.disconnect(self._on_paint)
+        self.layer.events.set_data.disconnect(self._on_set_data)
+        self.layer.events.data.disconnect(self.invalidate)
+        if self.image_layer is not None:
+            self.image_layer.events.data.disconnect(self.invalidate)
+
+    def _history_length(self):
+        history = getattr(self.layer, '_undo_history', None)
+        return None if history is None else len(history)
+
+    def _on_paint(self, event):
+        for atom in event.value:
+            labels, bounds = _atom_edit(atom, self.layer.data.shape)
+            if bounds is None:
+                continue
+            start, stop = bounds
+            for label in labels[labels != 0].tolist():
+                box_start, box_stop = start, stop
+                if label in self.boxes:
+                    previous_start, previous_stop = self.boxes[label]
+                    box_start, box_stop = np.minimum(start, previous_start), np.maximum(stop, previous_stop)
+                self.boxes[label] = (box_start, box_stop)
+        self._history = self._history_length()
+
+    def _on_set_data(self, event):
+        # undo and redo only emit set_data (also emitted e.g. when slicing),
+        # they are detected as a change of the undo history without paint
+        if self._history is None or self._history_length() != self._history:
+            self.invalidate()
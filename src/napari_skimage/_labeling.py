@@ -0,0 +1,138 @@
+"""
+Connected component labeling of arrays too large to be labeled at once. Each chunk is
+labeled independently (in parallel by dask) and only the first and last planes of its
+labels along each axis are kept. Labels of neighbouring chunks touching across a chunk
+boundary are then merged with a union-find (connected components of the graph of
+equivalent labels) and numbered consecutively. The output is a lazy dask array: each
+chunk is labeled again and relabeled when it is displayed or saved, so that neither the
+full volume nor its labels need to fit in memory, only the boundary planes.
+Labels produced by the widgets are stored with the smallest unsigned integer type
+holding their number (label_dtype), e.g. uint8 for masks instead of int64.
+"""
+
+import dask
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from skimage.measure import label
+
+from ._tiling import as_dask
+
+LABEL_TYPE = {'label': 'Label type', 'choices': ['auto', 'uint8', 'uint16', 'uint32', 'uint64']}
+
+
+def label_dtype(n_labels, dtype='auto'):
+    """Smallest unsigned integer type holding labels up to n_labels, or dtype if not 'auto'."""
+    if dtype != 'auto':
+        if n_labels > np.iinfo(dtype).max:
+            raise ValueError(f'{n_labels} labels do not fit in {dtype}')
+        return np.dtype(dtype)
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if n_labels <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+
+def as_labels(labels, n_labels=None, dtype='auto'):
+    """labels (e.g. a mask or int64 labels) converted to label_dtype, lazily for dask arrays."""
+    if n_labels is None:
+        n_labels = 1 if labels.dtype == bool else int(labels.max())
+    dtype = label_dtype(n_labels, dtype)
+    return labels if labels.dtype == dtype else labels.astype(dtype)
+
+
+def _label_block(block, connectivity, background):
+    labels, n_labels = label(block, connectivity=connectivity, background=background, return_num=True)
+    faces = [((labels.take(0, axis), block.take(0, axis)),
+              (labels.take(-1, axis), block.take(-1, axis))) for axis in range(block.ndim)]
+    return n_labels, faces
+
+
+def _plane_offsets(ndim, connectivity):
+    """Offsets in a boundary plane of the neighbours across the boundary."""
+    offsets = np.array(list(np.ndindex((3,) * ndim))) - 1
+    return offsets[np.count_nonzero(offsets, axis=1) + 1 <= connectivity]
+
+
+def _boundary_pairs(low, high, connectivity, background):
+    """Pairs of labels (low, high) touching across a boundary, given the labels and values of its two planes."""
+    (low_labels, low_values), (high_labels, high_values) = low, high
+    pairs = []
+    for offset in _plane_offsets(low_labels.ndim, connectivity):
+        first = tuple(slice(max(0, -o), s - max(0, o)) for s, o in zip(low_labels.shape, offset))
+        second = tuple(slice(max(0, o), s + min(0, o)) for s, o in zip(low_labels.shape, offset))
+        touching = ((low_values[first] == high_values[second]) & (low_values[first] != background))
+        pairs.append(np.stack([low_labels[first][touching], high_labels[second][touching]], axis=1))
+    return np.concatenate(pairs)
+
+
+def _assemble(faces, offsets, chunks, axis):
+    """Boundary plane of labels and values assembled from the faces of chunks (dict of block index to face)."""
+    shape = tuple(sum(c) for i, c in enumerate(chunks) if i != axis)
+    starts = [np.cumsum((0,) + c) for c in chunks]
+    labels, values = None, None
+    for block, (face_labels, face_values) in faces.items():
+        if labels is None:
+            labels = np.zeros(shape, dtype=np.int64)
+            values = np.zeros(shape, dtype=face_values.dtype)
+        region = tuple(slice(starts[i][b], starts[i][b + 1]) for i, b in enumerate(block) if i != axis)
+        labels[region] = np.where(face_labels > 0, face_labels + offsets[block], 0)
+        values[region] = face_values
+    return labels, values
+
+
+def _relabel_block(block, connectivity, background, offsets, lookup, block_info=None):
+    offset = offsets[tuple(block_info[0]['chunk-location'])]
+    labels = label(block, connectivity=connectivity, background=background)
+    return np.where(labels > 0, lookup[labels + offset], 0).astype(lookup.dtype)
+
+
+def chunked_label(data, connectivity=None, background=0, chunks=None, dtype='auto'):
+    """Lazily labeled connected components of data and their number.
+
+    Parameters
+    ----------
+    data : array-like
+        Image to label, see skimage.measure.label.
+    connectivity : int, optional
+        Maximum number of orthogonal hops to consider a pixel a neighbour,
+        by default data.ndim.
+    background : int
+        Value of the background pixels.
+    chunks : int or tuple, optional
+        Chunk size used to label the data, by default their own chunks.
+    dtype : str
+        Type of the labels, by default the smallest holding their number.
+    """
+    data = as_dask(data)
+    if chunks is not None:
+        data = data.rechunk(chunks)
+    connectivity = data.ndim if connectivity is None else connectivity
+    block_ids = list(np.ndindex(data.numblocks))
+    results = dict(zip(block_ids, dask.compute(
+        *[dask.delayed(_label_block)(data.blocks[b], connectivity, background) for b in block_ids])))
+
+    counts = np.array([results[b][0] for b in block_ids])
+    offsets = (np.cumsum(counts) - counts).reshape(data.numblocks)
+    n_local = int(counts.sum())
+
+    # labels touching across each boundary between chunks, from the last and first planes of the chunks
+    pairs = [np.empty((0, 2), dtype=np.int64)]
+    for axis in range(data.ndim):
+        for index in range(data.numblocks[axis] - 1):
+            low = _assemble({b: results[b][1][axis][1] for b in block_ids if b[axis] == index},
+                            offsets, data.chunks, axis)
+            high = _assemble({b: results[b][1][axis][0] for b in block_ids if b[axis] == index + 1},
+                             offsets, data.chunks, axis)
+            pairs.append(_boundary_pairs(low, high, connectivity, background))
+    pairs = np.concatenate(pairs)
+
+    # union-find of the equivalent labels, in the order of their first chunk
+    graph = coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(n_local + 1,) * 2)
+    n_labels, components = connected_components(graph, directed=False)
+    n_labels -= 1
+    lookup = components.astype(label_dtype(n_labels, dtype))
+
+    labeled = data.map_blocks(_relabel_block, connectivity, background, offsets, lookup,
+                              dtype=lookup.dtype)
+    return labeled, n_labels
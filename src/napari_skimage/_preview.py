@@ -0,0 +1,171 @@
+"""
+Live preview for parameter tuning. When the preview is enabled, every parameter change
+(debounced) recomputes the widget only for the displayed slice and the visible canvas
+region, extended by a halo so that the preview matches the full result. The preview is
+shown in a single layer which is updated in place. The widget function is called as
+usual within the preview_region context: run_in_worker then crops the data around the
+region (see preview_slices) and crops the result back to the region.
+"""
+
+from contextlib import contextmanager
+from functools import partial
+
+import napari
+import numpy as np
+from magicgui.widgets import CheckBox
+from napari.layers import Image
+from qtpy.QtCore import QTimer
+
+from ._tiling import apply_planes
+
+# halo used when the widget does not provide the kernel size of its function
+DEFAULT_HALO = 16
+DEBOUNCE_MS = 200
+
+_preview_region = None
+
+
+@contextmanager
+def preview_region(region):
+    """Within this context, run_in_worker only computes the given region."""
+    global _preview_region
+    _preview_region = region
+    try:
+        yield
+    finally:
+        _preview_region = None
+
+
+def get_preview_region():
+    return _preview_region
+
+
+def view_region(viewer, layer):
+    """Start and stop indices along each layer axis of the visible part of the displayed slice."""
+    shape = np.array(layer.data.shape)
+    start = np.clip(np.round(layer.world_to_data(viewer.dims.point)).astype(int), 0, shape - 1)
+    stop = start + 1
+    offset = viewer.dims.ndim - layer.ndim
+    for axis in [d - offset for d in viewer.dims.displayed if d >= offset]:
+        low, high = layer.corner_pixels[:, axis]
+        # corners are not set as long as the canvas has not been drawn
+        if high > low:
+            start[axis], stop[axis] = low, min(high + 1, shape[axis])
+        else:
+            start[axis], stop[axis] = 0, shape[axis]
+    return start, stop
+
+
+def preview_slices(shape, region, depth=None, plane_ndim=None, axis=None):
+    """Slices of the region extended by the halo (outer) and of the region within it (inner).
+
+    No halo is added along the processing axis and along the leading axes of
+    plane-wise functions, as those are processed independently.
+    """
+    ndim = len(shape)
+    if depth is None:
+        depth = DEFAULT_HALO
+    if np.isscalar(depth):
+        depth = (depth,) * ndim
+    depth = (0,) * (ndim - len(depth)) + tuple(depth)[-ndim:]
+    outer, inner = [], []
+    for ax, (start, stop) in enumerate(zip(*region)):
+        halo = depth[ax]
+        if ax == axis or (plane_ndim is not None and ax < ndim - plane_ndim):
+            halo = 0
+        outer_start, outer_stop = max(start - halo, 0), min(stop + halo, shape[ax])
+        outer.append(slice(outer_start, outer_stop))
+        inner.append(slice(start - outer_start, stop - outer_start))
+    return tuple(outer), tuple(inner)
+
+
+def compute_preview(func, data, inner, plane_ndim=None, axis=None):
+    """Apply func to the cropped data as it would be applied to the full data and crop the result."""
+    if plane_ndim is not None and data.ndim - (axis is not None) > plane_ndim:
+        func = partial(apply_planes, func, plane_ndim=plane_ndim)
+    if axis is not None:
+        frames = [func(np.take(data, i, axis=axis)) for i in range(data.shape[axis])]
+        if isinstance(frames[0], tuple):
+            out = tuple(np.stack(f, axis=axis) for f in zip(*frames))
+        else:
+            out = np.stack(frames, axis=axis)
+    else:
+        out = func(data)
+    if isinstance(out, tuple):
+        return tuple(o[inner] for o in out)
+    return out[inner]
+
+
+def update_preview(widget):
+    """Recompute the preview of a magic_factory widget for the current view."""
+    viewer = napari.current_viewer()
+    layer = widget[0].value
+    if not widget.preview.value or viewer is None or layer is None:
+        return
+    if widget._preview_worker is not None:
+        widget._preview_worker.quit()
+
+    region = view_region(viewer, layer)
+    bound = widget.__signature__.bind()
+    bound.apply_defaults()
+    with preview_region(region):
+        worker = widget.__wrapped__(*bound.args, **bound.kwargs)
+    worker.returned.connect(partial(_show_preview, widget, viewer, layer, region[0]))
+    widget._preview_worker = worker
+
+
+def _show_preview(widget, viewer, layer, start, layer_data):
+    # for widgets returning several layers, only the first one is previewed
+    if isinstance(layer_data, list):
+        layer_data = layer_data[0]
+    data, _, layer_type = layer_data
+    translate = np.asarray(layer.translate) + start * np.asarray(layer.scale)
+    preview = widget._preview_layer
+    if preview is not None and preview in viewer.layers and isinstance(preview, Image) == (layer_type == 'image'):
+        preview.data = data
+        preview.translate = translate
+        preview.scale = layer.scale
+        if isinstance(preview, Image):
+            preview.reset_contrast_limits()
+    else:
+        remove_preview(widget)
+        add_layer = viewer.add_image if layer_type == 'image' else viewer.add_labels
+        widget._preview_layer = add_layer(
+            data, name=f'{widget.label} preview', translate=translate, scale=layer.scale)
+
+
+def remove_preview(widget):
+    viewer = napari.current_viewer()
+    if viewer is not None and widget._preview_layer in viewer.layers:
+        viewer.layers.remove(widget._preview_layer)
+    widget._preview_layer = None
+
+
+def _on_toggle_preview(widget, value):
+    viewer = napari.current_viewer()
+    events = [] if viewer is None else [viewer.dims.events.current_step,
+                                        viewer.camera.events.center,
+                                        viewer.camera.events.zoom]
+    for event in events:
+        if value:
+            event.connect(widget._restart_preview_timer)
+        else:
+            event.disconnect(widget._restart_preview_timer)
+    if not value:
+        remove_preview(widget)
+
+
+def add_preview(widget):
+    """Add a "Preview" checkbox to a magic_factory widget whose function uses run_in_worker."""
+    widget._preview_layer = None
+    widget._preview_worker = None
+    widget._preview_timer = QTimer()
+    widget._preview_timer.setSingleShot(True)
+    widget._preview_timer.setInterval(DEBOUNCE_MS)
+    widget._preview_timer.timeout.connect(partial(update_preview, widget))
+    widget._restart_preview_timer = lambda *args: widget._preview_timer.start()
+
+    widget.preview = CheckBox(text='Preview', value=False)
+    widget.preview.changed.connect(partial(_on_toggle_preview, widget))
+    widget.changed.connect(widget._restart_preview_timer)
+    widget.extend([widget.preview])
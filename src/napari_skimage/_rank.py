@@ -0,0 +1,130 @@
+"""
+Engines for median and rank filters with large footprints. skimage.filters.median sorts
+the values under the footprint at each pixel, so that its cost grows with the number of
+footprint elements. For 8 and 16 bit images, the rank filters of skimage.filters.rank
+instead slide a histogram over the image, whose cost grows with the number of histogram
+bins and only with the perimeter of the footprint. The median filter switches to the
+sliding histogram when the footprint is large compared to the number of bins (see
+benchmarks/benchmark_rank_filters.py for the crossover) and pads the image according
+to the border mode so that the result is the same. Minimum and maximum filters with box
+footprints are computed with separable 1D filters (scipy.ndimage), whose cost does not
+depend on the footprint size. Finally, 16 bit and float images can be quantized into a
+chosen number of bins before applying a rank filter, trading accuracy for speed, and
+intensities are mapped back to the original range. Several statistics are computed one
+after the other on the same quantized image (sequential_rank_filters): skimage has no kernel
+deriving several statistics from one sliding histogram, so that only the reading and binning
+of the image are shared.
+"""
+
+import numpy as np
+import scipy.ndimage as ndi
+import skimage.filters as sf
+
+# number of footprint elements above which the sliding histogram is faster than sorting,
+# increased by HISTOGRAM_BIN_COST for each histogram bin
+LARGE_FOOTPRINT_SIZE = 12
+HISTOGRAM_BIN_COST = 1 / 16
+
+# rank filters returning intensities, and differences of intensities, of the input image
+INTENSITY_STATS = ['autolevel', 'autolevel_percentile', 'enhance_contrast', 'enhance_contrast_percentile',
+                   'equalize', 'geometric_mean', 'majority', 'maximum', 'mean', 'mean_percentile',
+                   'median', 'minimum', 'modal', 'otsu', 'percentile']
+DIFFERENCE_STATS = ['gradient', 'gradient_percentile']
+PERCENTILE_STATS = ['mean_percentile', 'subtract_mean_percentile', 'sum_percentile',
+                    'gradient_percentile', 'enhance_contrast_percentile', 'autolevel_percentile']
+
+# numpy padding modes equivalent to the scipy.ndimage border modes
+_PAD_MODES = {'reflect': 'symmetric', 'mirror': 'reflect', 'nearest': 'edge',
+              'wrap': 'wrap', 'constant': 'constant'}
+
+
+def histogram_bins(image):
+    """Number of histogram bins used by skimage.filters.rank for image."""
+    return 256 if image.dtype == np.uint8 else int(image.max()) + 1
+
+
+def use_histogram(image, footprint):
+    """Check whether the sliding histogram engine is faster for this image and footprint."""
+    if image.dtype not in (np.uint8, np.uint16) or image.ndim not in (2, 3) or footprint.ndim != image.ndim:
+        return False
+    n_bins = histogram_bins(image)
+    return np.count_nonzero(footprint) > LARGE_FOOTPRINT_SIZE + HISTOGRAM_BIN_COST * n_bins
+
+
+def histogram_median(image, footprint, mode='nearest', cval=0.0):
+    """Median filter of an 8 or 16 bit image with the sliding histogram of skimage.filters.rank."""
+    pad_width = [(s // 2, s - 1 - s // 2) for s in footprint.shape]
+    kwargs = {'constant_values': cval} if mode == 'constant' else {}
+    padded = np.pad(image, pad_width, mode=_PAD_MODES[mode], **kwargs)
+    out = sf.rank.median(padded, footprint=footprint)
+    return out[tuple(slice(before, before + n) for (before, _), n in zip(pad_width, image.shape))]
+
+
+def median(image, footprint, mode='nearest', cval=0.0):
+    """Median filter giving the same result as skimage.filters.median with the fastest engine."""
+    image = np.asarray(image)
+    if use_histogram(image, footprint):
+        return histogram_median(image, footprint, mode=mode, cval=cval)
+    return sf.median(image, footprint=footprint, mode=mode, cval=cval)
+
+
+def rank_filter(stat, image, footprint, **kwargs):
+    """Apply the filter stat of skimage.filters.rank, with separable filters for box minimum and maximum."""
+    image = np.asarray(image)
+    if stat in ('minimum', 'maximum') and footprint.all() and image.dtype in (np.uint8, np.uint16) and not kwargs:
+        # rank filters ignore pixels outside the image, as the nearest mode does for box footprints
+        return getattr(ndi, f'{stat}_filter')(image, size=footprint.shape, mode='nearest')
+    return getattr(sf.rank, stat)(image, footprint=footprint, **kwargs)
+
+
+def quantize(image, n_bins, low, high):
+    """Rescale the values of image from [low, high] to the integers 0 to n_bins - 1."""
+    dtype = np.uint8 if n_bins <= 256 else np.uint16
+    scale = (n_bins - 1) / (high - low) if high > low else 0
+    return np.clip(np.rint((np.asarray(image) - low) * scale), 0, n_bins - 1).astype(dtype)
+
+
+def unquantize(stat, out, dtype, n_bins, low, high):
+    """Map the result of the rank filter stat on a quantized image back to [low, high].
+
+    Intensities (e.g. mean, median) and differences of intensities (gradient) are
+    mapped back to the range and type of the original image, other statistics
+    (e.g. entropy) are returned as computed on the quantized image.
+    """
+    if stat not in INTENSITY_STATS + DIFFERENCE_STATS:
+        return out
+    out = out * ((high - low) / (n_bins - 1)) + (low if stat in INTENSITY_STATS else 0)
+    if np.issubdtype(dtype, np.integer):
+        return np.rint(out).astype(dtype)
+    return out.astype(dtype)
+
+
+def sequential_rank_filters(stats, image, footprint, n_bins=None, low=0, high=0, **kwargs):
+    """Apply several rank filters to image one after the other and return a tuple of results.
+
+    The image is read and, if n_bins is given, quantized between low and high
+    only once for all statistics, but each statistic is computed by its own
+    skimage filter (one pass over the image per statistic).
+    Only the gradient is derived from the minimum and maximum when those are
+    computed as well. kwargs (p0, p1) are only passed to the percentile statistics.
+    """
+    # Deriving the statistics from a single windowed_histogram is exact but slower:
+    # reducing the histograms of all pixels with numpy costs more than the C kernels
+    # of skimage.filters.rank, and the histograms take n_bins floats per pixel.
+    image = np.asarray(image)
+    source = image if n_bins is None else quantize(image, n_bins, low, high)
+    results = {}
+    for stat in sorted(stats, key=lambda stat: stat == 'gradient'):
+        if stat == 'gradient' and 'minimum' in results and 'maximum' in results:
+            results[stat] = results['maximum'] - results['minimum']
+        else:
+            stat_kwargs = kwargs if stat in PERCENTILE_STATS else {}
+            results[stat] = rank_filter(stat, source, footprint, **stat_kwargs)
+    if n_bins is not None:
+        results = {stat: unquantize(stat, out, image.dtype, n_bins, low, high) for stat, out in results.items()}
+    return tuple(results[stat] for stat in stats)
+
+
+def binned_rank_filter(stat, image, footprint, n_bins, low, high, **kwargs):
+    """Apply the rank filter stat to image quantized into n_bins between low and high."""
+    return sequential_rank_filters([stat], image, footprint, n_bins=n_bins, low=low, high=high, **kwargs)[0]
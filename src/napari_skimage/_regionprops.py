@@ -0,0 +1,260 @@
+"""
+Region properties of many labels computed in parallel. The bounding boxes of all labels
+are found in a single pass (scipy.ndimage.find_objects), then the labels are split in
+batches which are processed in a process pool, each on the crops of the label and
+intensity images to the bounding boxes of its labels. Coordinates (bbox, centroid etc.)
+are computed in the full image, so that the table, assembled in label order, is identical
+to the one of skimage.measure.regionprops_table.
+Simple properties (area, bbox, centroid, intensity statistics) are instead computed for
+all labels at once with reductions over the label image (bincount, scipy.ndimage), which
+is much faster than creating one region object per label. Their values are the same as
+those of skimage up to floating point rounding. Other properties are computed per region
+and both are merged into one table.
+The labels, bounding boxes and centroids of the rows of a table are indexed once per
+analysis (label_index), so that selecting a row needs no search of the label image. They
+are read from the columns of the table when it has them, otherwise the bounding boxes are
+found with scipy.ndimage.find_objects and centroids are computed in the bounding box of
+the selected label only (label_centroid).
+After labels are edited, only the rows of the edited labels are recomputed, on crops to
+their former bounding boxes and to the edited regions (update_regionprops_table).
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.ndimage as ndi
+from skimage.measure import regionprops_table
+from skimage.measure._regionprops import RegionProperties, _props_to_dict
+
+from ._execution import get_process_pool
+
+# number of labels from which the properties are computed in parallel
+PARALLEL_LABELS = 2000
+
+# properties computed for all labels at once by simple_regionprops_table
+SIMPLE_PROPERTIES = {'label', 'area', 'area_bbox', 'bbox', 'centroid', 'intensity_mean',
+                     'intensity_max', 'intensity_min', 'intensity_std'}
+
+
+class CroppedRegion(RegionProperties):
+    """Region of a crop of the label image starting at start, with coordinates in the full image."""
+
+    def __init__(self, start, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._start = np.asarray(start)
+
+    def __getitem__(self, key):
+        if key == 'slice':
+            return tuple(slice(s.start + o, s.stop + o) for s, o in zip(self.slice, self._start))
+        return super().__getitem__(key)
+
+    @property
+    def bbox(self):
+        return tuple(int(v) for v in np.concatenate([self._start, self._start]) + super().bbox)
+
+    @property
+    def coords(self):
+        return self._start + np.argwhere(self.image)
+
+    @property
+    def coords_scaled(self):
+        return (self._start + np.argwhere(self.image)) * self._spacing
+
+    @property
+    def centroid(self):
+        return tuple(self.coords_scaled.mean(axis=0))
+
+    @property
+    def centroid_weighted(self):
+        return tuple(c + s * spacing for c, s, spacing in
+                     zip(self.centroid_weighted_local, self._start, self._spacing))
+
+
+def _batch_table(batch, properties, spacing):
+    regions = [CroppedRegion(start, tuple(slice(0, s) for s in labels.shape), label, labels,
+                             intensity, True, spacing=spacing)
+               for label, start, labels, intensity in batch]
+    return _props_to_dict(regions, properties=properties, separator='-')
+
+
+def _coordinate(shape, axis):
+    """Coordinate along axis of each pixel of an array of the given shape (read-only view)."""
+    return np.broadcast_to(np.arange(shape[axis]).reshape([-1 if i == axis else 1 for i in range(len(shape))]),
+                           shape)
+
+
+def _extremum(ufunc, values, flat_labels, n_labels):
+    """Maximum or minimum of values for each label (ufunc is np.maximum or np.minimum)."""
+    info = np.finfo if values.dtype.kind == 'f' else np.iinfo
+    start = info(values.dtype).min if ufunc is np.maximum else info(values.dtype).max
+    out = np.full(n_labels, start, dtype=values.dtype)
+    ufunc.at(out, flat_labels, values.ravel())
+    return out
+
+
+def simple_regionprops_table(label_image, intensity_image=None, properties=('label', 'bbox'),
+                             spacing=None):
+    """regionprops_table of SIMPLE_PROPERTIES, computed for all labels at once."""
+    ndim = label_image.ndim
+    spacing = np.ones(ndim) if spacing is None else np.asarray(spacing, dtype=float)
+    flat_labels = label_image.ravel()
+    counts = np.bincount(flat_labels)
+    index = np.flatnonzero(counts[1:]) + 1
+
+    out = {}
+    for prop in properties:
+        if prop == 'label':
+            out['label'] = index
+        elif prop == 'area':
+            out['area'] = counts[index] * np.prod(spacing)
+        elif prop in ('bbox', 'area_bbox'):
+            coordinates = [_coordinate(label_image.shape, axis).ravel() for axis in range(ndim)]
+            bbox = np.stack([_extremum(np.minimum, c, flat_labels, len(counts))[index] for c in coordinates]
+                            + [_extremum(np.maximum, c, flat_labels, len(counts))[index] + 1 for c in coordinates],
+                            axis=1)
+            if prop == 'bbox':
+                out.update({f'bbox-{i}': bbox[:, i] for i in range(2 * ndim)})
+            else:
+                out['area_bbox'] = np.prod(bbox[:, ndim:] - bbox[:, :ndim], axis=1) * np.prod(spacing)
+        elif prop == 'centroid':
+            for axis in range(ndim):
+                sums = np.bincount(flat_labels, weights=_coordinate(label_image.shape, axis).ravel())
+                out[f'centroid-{axis}'] = sums[index] / counts[index] * spacing[axis]
+        elif prop in ('intensity_mean', 'intensity_std'):
+            intensity = intensity_image.ravel().astype(float)
+            mean = np.bincount(flat_labels, weights=intensity) / np.maximum(counts, 1)
+            if prop == 'intensity_mean':
+                out[prop] = mean[index]
+            else:
+                squares = np.bincount(flat_labels, weights=(intensity - mean[flat_labels]) ** 2)
+                out[prop] = np.sqrt(squares[index] / counts[index])
+        else:
+            ufunc = np.maximum if prop == 'intensity_max' else np.minimum
+            out[prop] = _extremum(ufunc, intensity_image, flat_labels, len(counts))[index].astype(float)
+    return out
+
+
+def _index(table, ndim):
+    """label_index of a table of the label, bbox and centroid properties."""
+    return {'label': np.asarray(table['label']),
+            'bbox': np.stack([table[f'bbox-{i}'] for i in range(2 * ndim)], axis=-1),
+            'centroid': np.stack([table[f'centroid-{i}'] for i in range(ndim)], axis=-1)}
+
+
+def label_index(label_image, table=None, spacing=None):
+    """Labels of label_image in increasing order with their bounding boxes and centroids in pixels.
+
+    Rows of regionprops tables are in the same order, so that the label and
+    location of the object of a row are found without searching the image.
+    The index is read from the label, bbox and centroid columns of table
+    (computed with spacing) if it has them. Otherwise, bounding boxes are
+    found with scipy.ndimage.find_objects and centroids are not indexed
+    (see label_centroid).
+    """
+    ndim = np.ndim(label_image)
+    bbox_columns = ['label'] + [f'bbox-{i}' for i in range(2 * ndim)]
+    if table is not None and all(column in table for column in bbox_columns):
+        labels = np.asarray(table['label'])
+        bbox = np.stack([table[f'bbox-{i}'] for i in range(2 * ndim)], axis=-1)
+    else:
+        objects = ndi.find_objects(np.asarray(label_image))
+        regions = [(label, region) for label, region in enumerate(objects, start=1) if region is not None]
+        labels = np.array([label for label, _ in regions], dtype=np.int64)
+        bbox = np.array([[s.start for s in region] + [s.stop for s in region] for _, region in regions],
+                        dtype=np.int64).reshape(-1, 2 * ndim)
+    index = {'label': labels, 'bbox': bbox}
+    if table is not None and all(f'centroid-{i}' in table for i in range(ndim)):
+        centroid = np.stack([table[f'centroid-{i}'] for i in range(ndim)], axis=-1)
+        index['centroid'] = centroid / (1 if spacing is None else np.asarray(spacing))
+    return index
+
+
+def label_centroid(label_image, label, bbox):
+    """Centroid in pixels of label, searched in its bounding box bbox (start and stop)."""
+    ndim = len(bbox) // 2
+    start, stop = np.asarray(bbox[:ndim]), np.asarray(bbox[ndim:])
+    crop = tuple(slice(int(a), int(b)) for a, b in zip(start, stop))
+    coordinates = np.nonzero(np.asarray(label_image[crop]) == label)
+    if coordinates[0].size == 0:
+        # the label was erased since the analysis
+        return (start + stop - 1) / 2
+    return start + np.array([c.mean() for c in coordinates])
+
+
+def compute_regionprops_table(label_image, intensity_image=None, properties=('label', 'bbox'),
+                              spacing=None, parallel=None, batch_size=None):
+    """Same as skimage.measure.regionprops_table, computed in parallel on crops of the labels.
+
+    SIMPLE_PROPERTIES are computed for all labels at once. By default
+    (parallel=None), the other properties are computed in parallel if there
+    are at least PARALLEL_LABELS labels and several CPUs.
+    """
+    simple = [prop for prop in properties if prop in SIMPLE_PROPERTIES]
+    # multichannel intensities are measured per region
+    if simple and label_image.any() and (intensity_image is None or intensity_image.ndim == label_image.ndim):
+        complex_properties = [prop for prop in properties if prop not in SIMPLE_PROPERTIES]
+        tables = [simple_regionprops_table(label_image, intensity_image, simple, spacing)]
+        if complex_properties:
+            tables.append(compute_regionprops_table(label_image, intensity_image, complex_properties,
+                                                    spacing, parallel, batch_size))
+        # columns in the order of the properties
+        columns = {key: values for table in tables for key, values in table.items()}
+        return {key: columns[key] for prop in properties for key in columns
+                if key == prop or key.startswith(f'{prop}-')}
+
+    objects = ndi.find_objects(label_image)
+    regions = [(label, region) for label, region in enumerate(objects, start=1) if region is not None]
+    if parallel is None:
+        parallel = len(regions) >= PARALLEL_LABELS and (os.cpu_count() or 1) > 1
+    if not regions or not parallel:
+        return regionprops_table(label_image, intensity_image, properties, spacing=spacing)
+    if batch_size is None:
+        # a few batches per worker to balance the load
+        batch_size = max(64, len(regions) // (4 * (os.cpu_count() or 1)) + 1)
+
+    batches = []
+    for first in range(0, len(regions), batch_size):
+        batches.append([(label, [s.start for s in region], label_image[region],
+                         None if intensity_image is None else intensity_image[region])
+                        for label, region in regions[first:first + batch_size]])
+    pool = get_process_pool()
+    tables = list(pool.map(_batch_table, batches, [properties] * len(batches), [spacing] * len(batches)))
+    return {key: np.concatenate([table[key] for table in tables]) for key in tables[0]}
+
+
+def update_regionprops_table(table, index, label_image, intensity_image, properties, spacing, edits):
+    """Region properties table (DataFrame) and label_index after labels were edited.
+
+    table and index were computed before the edits, edits maps each edited
+    label to the bounding box (start, stop) of its edits. Only the rows of
+    the edited labels are recomputed.
+    """
+    ndim = label_image.ndim
+    batch = []
+    for label, (start, stop) in sorted(edits.items()):
+        row = np.searchsorted(index['label'], label)
+        if row < len(index['label']) and index['label'][row] == label:
+            # pixels of the label are in its former bounding box or were painted
+            start = np.minimum(start, index['bbox'][row, :ndim])
+            stop = np.maximum(stop, index['bbox'][row, ndim:])
+        region = tuple(slice(int(a), int(b)) for a, b in zip(start, stop))
+        found = ndi.find_objects((np.asarray(label_image[region]) == label).astype(np.uint8))
+        if not found:
+            # the label was erased
+            continue
+        crop = tuple(slice(r.start + f.start, r.start + f.stop) for r, f in zip(region, found[0]))
+        batch.append((label, [c.start for c in crop], np.asarray(label_image[crop]),
+                      None if intensity_image is None else np.asarray(intensity_image[crop])))
+
+    keep = ~np.isin(index['label'], list(edits))
+    tables, indices = [table[keep]], [{key: values[keep] for key, values in index.items()}]
+    if batch:
+        tables.append(pd.DataFrame(_batch_table(batch, properties, spacing)))
+        indices.append(_index(_batch_table(batch, ('label', 'bbox', 'centroid'), None), ndim))
+
+    # rows in label order
+    order = np.argsort(np.concatenate([i['label'] for i in indices]), kind='stable')
+    table = pd.concat(tables, ignore_index=True).iloc[order].reset_index(drop=True)
+    index = {key: np.concatenate([i[key] for i in indices])[order] for key in indices[0]}
+    return table, index
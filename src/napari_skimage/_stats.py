@@ -0,0 +1,117 @@
+"""
+Statistics of image layers shared by the widgets. The minimum, maximum and histogram of
+a layer (from which percentiles are derived) are computed once, chunk by chunk for lazy
+layers, and cached until the data of the layer are replaced. Widgets use them to set the
+range of their sliders: request_statistics computes them in a background thread and calls
+back when they are ready, while get_statistics computes them immediately if needed.
+"""
+
+import weakref
+from functools import partial
+
+import dask.array as da
+import numpy as np
+from napari.qt.threading import create_worker
+
+from ._histogram import streaming_histogram
+from ._tiling import as_dask
+
+_statistics = weakref.WeakKeyDictionary()
+_pending = weakref.WeakKeyDictionary()
+_watched = weakref.WeakSet()
+
+
+class ImageStatistics:
+    """Minimum, maximum and histogram (counts and bin centers) of an image."""
+
+    def __init__(self, vmin, vmax, counts, centers):
+        self.min = vmin
+        self.max = vmax
+        self.counts = counts
+        self.centers = centers
+
+    def percentile(self, q):
+        """Approximate q-th percentile, exact for integer images."""
+        cumulative = np.cumsum(self.counts)
+        index = np.searchsorted(cumulative, q / 100 * cumulative[-1])
+        return self.centers[min(index, len(self.centers) - 1)]
+
+
+def compute_statistics(data, nbins=256):
+    """Statistics of data, computed chunk by chunk."""
+    data = as_dask(data)
+    if data.dtype == bool:
+        data = data.astype(np.uint8)
+    if data.dtype.kind in 'iu':
+        counts, centers = streaming_histogram(data, nbins=nbins)
+        return ImageStatistics(centers[0], centers[-1], counts, centers)
+    low, high = (float(v) for v in da.compute(da.nanmin(data), da.nanmax(data)))
+    counts, centers = streaming_histogram(data, nbins=nbins, value_range=(low, high))
+    return ImageStatistics(low, high, counts, centers)
+
+
+def _invalidate(event):
+    _statistics.pop(event.source, None)
+
+
+def _watch(layer):
+    if layer not in _watched:
+        layer.events.data.connect(_invalidate)
+        _watched.add(layer)
+
+
+def get_statistics(layer):
+    """Statistics of layer, computed now if they are not cached."""
+    if layer not in _statistics:
+        _watch(layer)
+        _statistics[layer] = compute_statistics(layer.data)
+    return _statistics[layer]
+
+
+def request_statistics(layer, callback):
+    """Call callback with the statistics of layer, computed in a background thread if needed."""
+    if layer in _statistics:
+        callback(_statistics[layer])
+        return
+    if layer in _pending:
+        _pending[layer].append(callback)
+        return
+    _watch(layer)
+    _pending[layer] = [callback]
+    worker = create_worker(compute_statistics, layer.data, _start_thread=False)
+    worker.returned.connect(partial(_on_statistics, weakref.ref(layer), layer.data))
+    worker.start()
+    return worker
+
+
+def _on_statistics(layer_ref, data, statistics):
+    layer = layer_ref()
+    if layer is None:
+        return
+    callbacks = _pending.pop(layer, [])
+    if layer.data is not data:
+        # the data were replaced during the computation
+        for callback in callbacks:
+            request_statistics(layer, callback)
+        return
+    _statistics[layer] = statistics
+    for callback in callbacks:
+        callback(statistics)
+
+
+def _set_ranges(layer_widget, layer, value_widgets, statistics):
+    if layer_widget.value is not layer:
+        return
+    for widget in value_widgets:
+        widget.min, widget.max = float(statistics.min), float(statistics.max)
+
+
+def connect_value_ranges(layer_widget, value_widgets):
+    """Set the range of value_widgets to the intensity range of the layer chosen in layer_widget."""
+    def update_ranges(event=None):
+        layer = layer_widget.value
+        if layer is not None:
+            request_statistics(layer, partial(_set_ranges, layer_widget, layer, value_widgets))
+
+    layer_widget.changed.connect(update_ranges)
+    update_ranges()
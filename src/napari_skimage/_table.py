@@ -0,0 +1,131 @@
+"""
+Table of results (e.g. region properties) for large DataFrames. Instead of creating one
+item per cell, the table view reads the cells it displays from the columns of the
+DataFrame through a Qt model, so that only the visible rows are rendered. Sorting and
+filtering only change the order of the displayed rows (an index into the DataFrame) and
+never copy the data.
+"""
+
+import numpy as np
+import pandas as pd
+from magicgui.widgets import Container, LineEdit
+from napari.utils.notifications import show_warning
+from qtpy.QtCore import QAbstractTableModel, Qt
+from qtpy.QtWidgets import QAbstractItemView, QHeaderView, QTableView
+
+# errors of invalid filter expressions, e.g. 'area >', 'unknown > 1' or 'area.max'
+FILTER_ERRORS = (SyntaxError, pd.errors.UndefinedVariableError, KeyError, AttributeError,
+                 TypeError, ValueError)
+
+
+class DataFrameModel(QAbstractTableModel):
+    """Read-only Qt model of a DataFrame showing the rows given by an index."""
+
+    def __init__(self, data=None, parent=None):
+        super().__init__(parent)
+        self.set_data(pd.DataFrame() if data is None else data)
+
+    def set_data(self, data):
+        self.beginResetModel()
+        self._data = data
+        self._columns = [data[column].to_numpy() for column in data.columns]
+        self.rows = np.arange(len(data))
+        self._sort_column, self._sort_order = None, Qt.AscendingOrder
+        self.endResetModel()
+
+    def rowCount(self, parent=None):
+        return 0 if parent is not None and parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=None):
+        return 0 if parent is not None and parent.isValid() else len(self._columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        value = self._columns[index.column()][self.rows[index.row()]]
+        if isinstance(value, (float, np.floating)):
+            return f'{value:.6g}'
+        return str(value)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return str(self._data.columns[section])
+        return str(self.rows[section])
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self._sort_column, self._sort_order = column, order
+        try:
+            # no column (-1) restores the order of the DataFrame
+            restore = not 0 <= column < len(self._columns)
+            keys = self.rows if restore else self._columns[column][self.rows]
+            ordered = np.argsort(keys, kind='stable')
+        except (TypeError, ValueError):
+            # e.g. columns of arrays (coords) cannot be sorted
+            return
+        if order == Qt.DescendingOrder and not restore:
+            ordered = ordered[::-1]
+        self.layoutAboutToBeChanged.emit()
+        self.rows = self.rows[ordered]
+        self.layoutChanged.emit()
+
+    def filter(self, expression=''):
+        """Only show the rows for which expression (e.g. 'area > 10') is true."""
+        mask = self._data.eval(expression) if expression else np.ones(len(self._data), dtype=bool)
+        self.beginResetModel()
+        self.rows = np.flatnonzero(np.asarray(mask, dtype=bool))
+        self.endResetModel()
+        if self._sort_column is not None:
+            self.sort(self._sort_column, self._sort_order)
+
+
+class ResultsTable(Container):
+    """Sortable and filterable table of a DataFrame only rendering its visible rows."""
+
+    def __init__(self, name="Results Table"):
+        super().__init__(name=name)
+        self.model = DataFrameModel()
+        self.view = QTableView()
+        self.view.setModel(self.model)
+        self.view.setSortingEnabled(True)
+        self.view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        # fixed row heights so that rows are not measured one by one
+        self.view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.view.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+
+        self.filter = LineEdit(label="Filter (e.g. area > 10)")
+        self.filter.changed.connect(self._on_filter)
+        self.extend([self.filter])
+        self.native.layout().addWidget(self.view)
+
+    @property
+    def value(self):
+        return self.model._data
+
+    @value.setter
+    def value(self, data):
+        self.model.set_data(data)
+        self.view.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self._on_filter()
+
+    @property
+    def column_headers(self):
+        return tuple(self.value.columns)
+
+    def current_row(self):
+        """Row of the DataFrame selected in the table, None if there is none."""
+        index = self.view.currentIndex()
+        return int(self.model.rows[index.row()]) if index.isValid() else None
+
+    def _on_filter(self, event=None):
+        try:
+            self.model.filter(self.filter.value)
+        except FILTER_ERRORS as error:
+            show_warning(f"Invalid filter: {error}")
+
+    def to_dataframe(self):
+        """DataFrame of the rows shown in the table, in their displayed order."""
+        if len(self.model.rows) == len(self.value) and np.all(np.diff(self.model.rows) > 0):
+            return self.value
+        return self.value.iloc[self.model.rows].reset_index(drop=True)
@@ -1,17 +1,30 @@
+import warnings
 import pytest
 import numpy as np
+import dask.array as da
+import skimage.morphology as sm
 
 from napari_skimage.skimage_morphology_widget import (
     binary_morphology_widget,
     morphology_widget
 )
 from napari_skimage.skimage_threshold_widget import threshold_widget, ManualThresholdWidget
+import napari_skimage.skimage_threshold_widget as sthw
 import napari_skimage.skimage_filter_widget as sfw
 import napari_skimage.mathsops as nsm
 from napari_skimage.skimage_label_widget import label_widget
+from napari_skimage._cache import ResultCache
+import napari_skimage._cache as cache_module
+from napari_skimage._distance import distance_morphology
+import napari_skimage._footprints as footprints_module
+from napari_skimage._footprints import get_footprint
+from napari_skimage._preview import preview_slices
+from napari_skimage._stats import get_statistics
+import napari_skimage._vesselness as vesselness_module
+import napari_skimage._fft as fft_module
 
 # single fun test
-def test_farid_filter_widget(make_napari_viewer):
+def test_farid_filter_widget(make_napari_viewer, qtbot):
     viewer = make_napari_viewer()
     random_image = np.random.random((100, 100))
     layer = viewer.add_image(random_image)
@@ -19,11 +32,17 @@ def test_farid_filter_widget(make_napari_viewer):
     # our widget will be a MagicFactory or FunctionGui instance
     my_widget = sfw.farid_filter_widget()
 
-    filtered, _, _ = my_widget(viewer.layers[0])
+    # filters run in a background worker returning a LayerDataTuple
+    worker = my_widget(viewer.layers[0])
+    with qtbot.waitSignal(worker.returned) as blocker:
+        pass
+    filtered, _, _ = blocker.args[0]
     assert filtered.shape == random_image.shape
+    qtbot.waitUntil(lambda: len(viewer.layers) == 2)
+    assert viewer.layers[1].name == f'{layer.name}_farid'
 
 # multifun
-def test_filters(make_napari_viewer):
+def test_filters(make_napari_viewer, qtbot):
 
     filter_list = ["farid_filter_widget",
                    "prewitt_filter_widget",
@@ -41,10 +60,344 @@ def test_filters(make_napari_viewer):
 
         filt = getattr(sfw, filt)
         my_widget = filt()
-        filtered, _, _ = my_widget(viewer.layers[0])
+        worker = my_widget(viewer.layers[0])
+        with qtbot.waitSignal(worker.returned) as blocker:
+            pass
+        filtered, _, _ = blocker.args[0]
         assert filtered.shape == random_image.shape, f"Filter {filt} failed"
 
-def test_rank_filter_widget(make_napari_viewer):
+def test_filters_lazy_data(make_napari_viewer, qtbot):
+    viewer = make_napari_viewer()
+    random_image = np.random.random((60, 80))
+    viewer.add_image(da.from_array(random_image, chunks=(20, 20)))
+
+    # lazy layers are filtered tile by tile into a lazy output
+    for filt in ["farid_filter_widget", "prewitt_filter_widget",
+                 "laplace_filter_widget", "gaussian_filter_widget",
+                 "median_filter_widget"]:
+        my_widget = getattr(sfw, filt)()
+        worker = my_widget(viewer.layers[0])
+        with qtbot.waitSignal(worker.returned) as blocker:
+            pass
+        filtered, _, _ = blocker.args[0]
+        assert isinstance(filtered, da.Array), f"Filter {filt} failed"
+
+        worker = my_widget(viewer.add_image(random_image))
+        with qtbot.waitSignal(worker.returned) as blocker:
+            pass
+        expected, _, _ = blocker.args[0]
+        np.testing.assert_allclose(filtered.compute(), expected, err_msg=f"Filter {filt} failed")
+
+def test_filters_lazy_data_halo(make_napari_viewer, qtbot):
+    viewer = make_napari_viewer()
+    stack = np.random.random((3, 60, 80))
+    image = viewer.add_image(stack)
+
+    def run(widget, layer, **kwargs):
+        worker = widget(layer, **kwargs)
+        with qtbot.waitSignal(worker.returned) as blocker:
+            pass
+        return np.asarray(blocker.args[0][0])
+
+    # the halo of the Gaussian (4) is larger than the first axis
+    for chunks in [(3, 20, 20), (1, 20, 20)]:
+        lazy = viewer.add_image(da.from_array(stack, chunks=chunks))
+        widget = sfw.gaussian_filter_widget()
+        np.testing.assert_allclose(run(widget, lazy), run(widget, image))
+
+    # with mode='wrap', the halo of edge tiles comes from the opposite edge
+    lazy = viewer.add_image(da.from_array(stack[0], chunks=(20, 20)))
+    plane = viewer.add_image(stack[0])
+    for filt in ["gaussian_filter_widget", "farid_filter_widget", "median_filter_widget"]:
+        widget = getattr(sfw, filt)()
+        np.testing.assert_allclose(run(widget, lazy, mode='wrap'), run(widget, plane, mode='wrap'),
+                                   err_msg=f"Filter {filt} failed")
+
+def test_process_along_axis(make_napari_viewer, qtbot):
+    viewer = make_napari_viewer()
+    random_image = np.random.random((3, 40, 40))
+    random_image[1] += 10
+    viewer.add_image(random_image)
+
+    # each frame along the chosen axis is processed independently
+    my_widget = sfw.gaussian_filter_widget()
+    assert my_widget.process_axis.choices == (None, 0)
+    worker = my_widget(viewer.layers[0], sigma=2.0, process_axis=0)
+    with qtbot.waitSignal(worker.returned, timeout=60000) as blocker:
+        pass
+    filtered, _, _ = blocker.args[0]
+    for i in range(3):
+        np.testing.assert_allclose(filtered[i], sfw.sf.gaussian(random_image[i], sigma=2.0, mode='reflect'))
+
+    my_widget = threshold_widget()
+    worker = my_widget(viewer.layers[0], process_axis=0)
+    with qtbot.waitSignal(worker.returned, timeout=60000) as blocker:
+        pass
+    mask, _, layer_type = blocker.args[0]
+    assert layer_type == 'labels'
+    assert all(mask[i].any() and not mask[i].all() for i in range(3))
+
+def test_filter_result_cache(make_napari_viewer, qtbot, monkeypatch):
+    viewer = make_napari_viewer()
+    viewer.add_image(np.random.random((50, 50)))
+    my_widget = sfw.gaussian_filter_widget()
+
+    results = []
+    for sigma in [1.0, 2.0, 1.0]:
+        worker = my_widget(viewer.layers[0], sigma=sigma)
+        with qtbot.waitSignal(worker.returned) as blocker:
+            pass
+        results.append(blocker.args[0][0])
+
+    # identical inputs and parameters are served from the cache
+    assert results[2] is results[0]
+    assert results[1] is not results[0]
+    # cached results cannot be changed through the layers sharing them
+    with pytest.raises(ValueError):
+        results[0][0, 0] = 0
+
+    # the cache is bounded by its memory budget
+    cache = ResultCache(max_bytes=2 * results[0].nbytes)
+    for key in range(3):
+        cache.put(key, results[0].copy())
+    assert len(cache) == 2 and cache.get(0) is None
+    assert cache.nbytes <= cache.max_bytes
+
+    # inputs larger than the budget are not hashed
+    monkeypatch.setattr(cache_module.result_cache, 'max_bytes', results[0].nbytes - 1)
+    monkeypatch.setattr(cache_module, 'fingerprint', lambda data: pytest.fail('hashed'))
+    worker = my_widget(viewer.layers[0], sigma=1.0)
+    with qtbot.waitSignal(worker.returned) as blocker:
+        pass
+    assert blocker.args[0][0] is not results[0]
+
+def test_filter_precision(make_napari_viewer, qtbot, monkeypatch):
+    viewer = make_napari_viewer()
+    image = (np.random.random((40, 40)) * 60000).astype(np.uint16)
+    viewer.add_image(image)
+    my_widget = sfw.gaussian_filter_widget()
+
+    results = {}
+    for precision in ['auto', 'float32', 'float64']:
+        worker = my_widget(viewer.layers[0], sigma=2.0, precision=precision)
+        with qtbot.waitSignal(worker.returned) as blocker:
+            pass
+        results[precision] = blocker.args[0][0]
+
+    # small inputs keep the skimage default, float32 results match it
+    assert results['auto'].dtype == np.float64
+    assert results['float32'].dtype == np.float32
+    expected = sfw.sf.gaussian(image, sigma=2.0, mode='reflect')
+    np.testing.assert_allclose(results['float64'], expected)
+    np.testing.assert_allclose(results['float32'], expected, rtol=1e-5, atol=1e-6)
+
+    # large inputs give float32 results by default
+    monkeypatch.setattr('napari_skimage._execution.LARGE_DATA_SIZE', image.size)
+    out, _, _ = nsm.simple_maths_widget()(viewer.layers[0], operation='sqrt')
+    assert out.dtype == np.float32
+    out, _, _ = nsm.simple_maths_widget()(viewer.layers[0], operation='sqrt', precision='float64')
+    assert out.dtype == np.float64
+
+def test_frangi_scale_space(make_napari_viewer, qtbot, monkeypatch):
+    viewer = make_napari_viewer()
+    image = np.random.random((40, 40))
+    viewer.add_image(image)
+    my_widget = sfw.frangi_filter_widget()
+
+    calls = []
+    hessian_matrix = vesselness_module.hessian_matrix
+    monkeypatch.setattr(vesselness_module, 'hessian_matrix',
+                        lambda *args, **kwargs: calls.append(args[1]) or hessian_matrix(*args, **kwargs))
+
+    for black_ridges in [True, False]:
+        worker = my_widget(viewer.layers[0], scale_start=1.0, scale_end=5.0, scale_step=1.0,
+                           black_ridges=black_ridges, scale_map=True)
+        with qtbot.waitSignal(worker.returned) as blocker:
+            pass
+        (vesselness, _, _), (scale, kwargs, _) = blocker.args[0]
+        expected = sfw.sf.frangi(image, sigmas=np.arange(1.0, 5.0, 1.0), black_ridges=black_ridges)
+        np.testing.assert_allclose(vesselness, expected, atol=1e-12)
+        assert kwargs['name'] == f'{viewer.layers[0].name}_frangi_scale'
+        assert set(np.unique(scale)) <= {0, 1, 2, 3, 4}
+        assert np.all((scale > 0) == (vesselness > 0))
+
+    # the Hessian at each scale is computed once and reused for the other polarity
+    assert calls == [1.0, 2.0, 3.0, 4.0]
+
+def test_butterworth_mask_cache(make_napari_viewer, qtbot, monkeypatch):
+    viewer = make_napari_viewer()
+    frames = np.random.random((4, 40, 50))
+    viewer.add_image(frames)
+    my_widget = sfw.butterworth_filter_widget()
+
+    masks = []
+    build_mask = fft_module._build_mask
+    monkeypatch.setattr(fft_module, '_build_mask',
+                        lambda *args: masks.append(args[0]) or build_mask(*args))
+    cache_module.result_cache.clear()
+    worker = my_widget(viewer.layers[0], cuttoff_frequency_ratio=0.1, parallel_fft=True)
+    with qtbot.waitSignal(worker.returned) as blocker:
+        pass
+    expected = sfw.sf.butterworth(frames, cutoff_frequency_ratio=0.1)
+    np.testing.assert_allclose(blocker.args[0][0], expected)
+
+    # the mask of a frame shape is built once and reused for all frames
+    for frame in frames:
+        np.testing.assert_allclose(
+            fft_module.butterworth(frame, cutoff_frequency_ratio=0.1),
+            sfw.sf.butterworth(frame, cutoff_frequency_ratio=0.1))
+    assert masks == [(4, 40, 50), (40, 50)]
+
+    # masks are not kept beyond the memory budget of the cache
+    monkeypatch.setattr(cache_module.result_cache, 'max_bytes', 0)
+    for _ in range(2):
+        fft_module.butterworth(frames[0], cutoff_frequency_ratio=0.2)
+    assert len(masks) == 4
+
+def test_filter_preview(make_napari_viewer, qtbot):
+    viewer = make_napari_viewer()
+    random_image = np.random.random((10, 60, 60))
+    layer = viewer.add_image(random_image)
+    my_widget = sfw.gaussian_filter_widget()
+    my_widget.sigma.value = 1.5
+
+    # enabling the preview computes the displayed slice only
+    my_widget.preview.value = True
+    qtbot.waitUntil(lambda: my_widget._preview_layer is not None, timeout=5000)
+    preview = my_widget._preview_layer
+    z = int(viewer.dims.current_step[0])
+    assert preview.data.shape == (1, 60, 60)
+    assert preview.translate[0] == z
+    expected = sfw.sf.gaussian(random_image, sigma=1.5, mode='reflect')[z]
+    np.testing.assert_allclose(preview.data[0], expected)
+
+    # changing a parameter updates the same preview layer
+    my_widget.sigma.value = 3.0
+    qtbot.waitUntil(lambda: not np.allclose(preview.data[0], expected), timeout=5000)
+    assert my_widget._preview_layer is preview
+    assert len(viewer.layers) == 2
+
+    my_widget.preview.value = False
+    assert preview not in viewer.layers
+
+    # global filters have no preview
+    assert not hasattr(sfw.frangi_filter_widget(), 'preview')
+    assert not hasattr(sfw.butterworth_filter_widget(), 'preview')
+
+    # a visible region is extended by the halo, except along the processing axis
+    outer, inner = preview_slices((10, 60, 60), ([5, 10, 10], [6, 20, 20]), depth=4, axis=0)
+    assert outer == (slice(5, 6), slice(6, 24), slice(6, 24))
+    assert inner == (slice(0, 1), slice(4, 14), slice(4, 14))
+
+def test_median_filter_widget_planes(make_napari_viewer, qtbot):
+    viewer = make_napari_viewer()
+    random_image = np.random.randint(0, 100, (3, 50, 50), dtype=np.uint8)
+    viewer.add_image(random_image)
+
+    # a 2D footprint on a 3D stack is applied plane by plane
+    my_widget = sfw.median_filter_widget()
+    worker = my_widget(viewer.layers[0])
+    with qtbot.waitSignal(worker.returned) as blocker:
+        pass
+    filtered, _, _ = blocker.args[0]
+    assert filtered.shape == random_image.shape
+    assert worker.pbar.total == 3
+    for i in range(3):
+        expected = sfw.sf.median(random_image[i], footprint=sfw.sm.disk(3), mode='nearest')
+        np.testing.assert_array_equal(filtered[i], expected)
+
+def test_large_footprint_rank_engines(make_napari_viewer, qtbot):
+    viewer = make_napari_viewer()
+    random_image = np.random.randint(0, 255, (60, 60), dtype=np.uint8)
+    viewer.add_image(random_image)
+
+    # large footprints use the sliding histogram, with the same result for all modes
+    my_widget = sfw.median_filter_widget()
+    for mode in my_widget.mode.choices:
+        worker = my_widget(viewer.layers[0], footprint_size=8, mode=mode)
+        with qtbot.waitSignal(worker.returned) as blocker:
+            pass
+        expected = sfw.sf.median(random_image, footprint=sfw.sm.disk(8), mode=mode)
+        np.testing.assert_array_equal(blocker.args[0][0], expected)
+
+    # box minimum and maximum use separable filters
+    my_widget = sfw.RankFilterWidget(viewer=viewer)
+    my_widget.footprint.value = 'square'
+    my_widget.footprint_size.value = 10
+    for stat in ['minimum', 'maximum']:
+        my_widget.stat.value = stat
+        worker = my_widget._rank_filter_im()
+        with qtbot.waitSignal(worker.returned) as blocker:
+            pass
+        expected = getattr(sfw.sf.rank, stat)(random_image, footprint=np.ones((10, 10)))
+        np.testing.assert_array_equal(blocker.args[0][0], expected)
+
+def test_binned_rank_filter_widget(make_napari_viewer, qtbot):
+    viewer = make_napari_viewer()
+    image12 = np.random.randint(0, 4096, (60, 60)).astype(np.uint16)
+    image12[0, 0], image12[0, 1] = 0, 4095
+    float_image = np.random.random((60, 60)) * 1000
+    viewer.add_image(image12)
+    viewer.add_image(float_image)
+
+    my_widget = sfw.RankFilterWidget(viewer=viewer)
+    my_widget.stat.value = 'median'
+    my_widget.footprint_size.value = 2
+    footprint = sfw.sm.disk(2)
+
+    def run(layer, n_bins):
+        my_widget._image_layer_combo.value = layer
+        my_widget.n_bins.value = n_bins
+        n_layers = len(viewer.layers)
+        # the statistics used for binning are computed in the background
+        assert my_widget._rank_filter_im() is None
+        qtbot.waitUntil(lambda: len(viewer.layers) == n_layers + 1, timeout=10000)
+        return viewer.layers[-1].data
+
+    # with one bin per value, binning does not change the result
+    np.testing.assert_array_equal(run(viewer.layers[0], 4096), sfw.sf.rank.median(image12, footprint=footprint))
+
+    # float data are binned and mapped back to their range, with an error below the bin size
+    filtered = run(viewer.layers[1], 256)
+    assert filtered.dtype == float_image.dtype
+    step = np.ptp(float_image) / 255
+    expected = sfw.sf.median(float_image, footprint=footprint, mode='nearest')
+    assert np.abs(filtered - expected)[2:-2, 2:-2].max() <= step
+
+def test_rank_filter_several_stats(make_napari_viewer, qtbot):
+    viewer = make_napari_viewer()
+    random_image = np.random.randint(0, 255, (2, 50, 50), dtype=np.uint8)
+    viewer.add_image(random_image, name='image')
+
+    my_widget = sfw.RankFilterWidget(viewer=viewer)
+    my_widget.stat.value = 'mean'
+    my_widget.more_stats.value = ['gradient', 'minimum', 'maximum', 'entropy']
+    worker = my_widget._rank_filter_im()
+    with qtbot.waitSignal(worker.finished):
+        pass
+
+    # one layer per statistic, computed plane by plane
+    stats = ['mean', 'gradient', 'minimum', 'maximum', 'entropy']
+    assert {layer.name for layer in viewer.layers[1:]} == {f'image_{stat}' for stat in stats}
+    footprint = sfw.sm.disk(3)
+    for stat in stats:
+        expected = getattr(sfw.sf.rank, stat)(random_image[1], footprint=footprint)
+        np.testing.assert_array_equal(viewer.layers[f'image_{stat}'].data[1], expected)
+
+def test_cancel_filter_widget(make_napari_viewer, qtbot):
+    viewer = make_napari_viewer()
+    viewer.add_image(np.random.random((5, 50, 50)))
+
+    my_widget = sfw.median_filter_widget()
+    worker = my_widget(viewer.layers[0])
+    assert my_widget.cancel_button.enabled
+    my_widget.cancel_button.clicked.emit(True)
+    assert worker.abort_requested
+    with qtbot.waitSignal(worker.finished):
+        pass
+    assert len(viewer.layers) == 1
+
+def test_rank_filter_widget(make_napari_viewer, qtbot):
     viewer = make_napari_viewer()
     random_image = np.random.randint(0, 100, (100, 100), dtype=np.uint8)
     layer = viewer.add_image(random_image)
@@ -55,7 +408,9 @@ def test_rank_filter_widget(make_napari_viewer):
     for choice in my_widget.stat.choices:
         my_widget.stat.native.setCurrentText(choice)
 
-        my_widget._rank_filter_im()
+        worker = my_widget._rank_filter_im()
+        with qtbot.waitSignal(worker.finished):
+            pass
         filtered = viewer.layers[1]
         assert filtered.data.shape == random_image.shape
 
@@ -87,7 +442,111 @@ def test_morphology_widget(make_napari_viewer):
         filtered, _, _ = my_widget(viewer.layers[0])
         assert filtered.data.shape == random_image.shape
 
-def test_thresholding_widget(make_napari_viewer):
+def test_morphology_decomposed_footprints(make_napari_viewer):
+    viewer = make_napari_viewer()
+    image = np.random.randint(0, 255, (80, 80), dtype=np.uint8)
+    viewer.add_image(image)
+    viewer.add_labels((image > 100).astype(np.uint8))
+
+    # footprints are cached and large ones are decomposed
+    assert get_footprint('disk', 2) is get_footprint('disk', 2)
+    assert isinstance(get_footprint('disk', 10), tuple)
+    assert not isinstance(get_footprint('disk', 10, decompose=False), tuple)
+    # the decomposition of balls is approximate and only used on request
+    assert not isinstance(get_footprint('ball', 10), tuple)
+    assert isinstance(get_footprint('ball', 10, approximate=True), tuple)
+
+    # decomposed footprints give the same results as dense ones
+    for footprint in ['disk', 'octagon', 'diamond']:
+        for decompose in [True, False]:
+            out, _, _ = morphology_widget()(viewer.layers[0], method='opening', footprint=footprint,
+                                            footprint_size=10, decompose=decompose)
+            binary, _, _ = binary_morphology_widget()(viewer.layers[1], method='closing', footprint=footprint,
+                                                      footprint_size=20, decompose=decompose)
+            if decompose:
+                expected, expected_binary = out, binary
+        np.testing.assert_array_equal(out, expected)
+        np.testing.assert_array_equal(binary, expected_binary)
+
+    volume = np.random.randint(0, 255, (20, 30, 30), dtype=np.uint8)
+    volume_layer = viewer.add_image(volume)
+    mask_layer = viewer.add_labels((volume > 100).astype(np.uint8))
+    for decompose in [True, False]:
+        out, _, _ = morphology_widget()(volume_layer, method='opening', footprint='ball',
+                                        footprint_size=3, decompose=decompose)
+        binary, _, _ = binary_morphology_widget()(mask_layer, method='closing', footprint='ball',
+                                                  footprint_size=3, decompose=decompose,
+                                                  distance_transform=False)
+        np.testing.assert_array_equal(out, sm.opening(volume, sm.ball(3)))
+        np.testing.assert_array_equal(binary, sm.binary_closing(volume > 100, sm.ball(3)))
+
+def test_rectangle_footprints_before_footprint_rectangle(monkeypatch):
+    # scikit-image < 0.25 has no footprint_rectangle
+    expected = [footprints_module.make_footprint(shape, 5, decomposition)
+                for shape in ['square', 'cube'] for decomposition in [None, 'sequence']]
+    footprints_module.make_footprint.cache_clear()
+    monkeypatch.delattr(sm, 'footprint_rectangle', raising=False)
+    with warnings.catch_warnings():
+        # square and cube are deprecated in recent versions
+        warnings.simplefilter('ignore', FutureWarning)
+        footprints = [footprints_module.make_footprint(shape, 5, decomposition)
+                      for shape in ['square', 'cube'] for decomposition in [None, 'sequence']]
+    footprints_module.make_footprint.cache_clear()
+    for footprint, expected_footprint in zip(footprints, expected):
+        for array, expected_array in zip(footprints_module._arrays(footprint),
+                                         footprints_module._arrays(expected_footprint)):
+            np.testing.assert_array_equal(array, expected_array)
+
+def test_binary_morphology_distance_transform(make_napari_viewer):
+    viewer = make_napari_viewer()
+    mask = sfw.sf.gaussian(np.random.random((30, 60, 60)), 2) > 0.5
+    viewer.add_labels(mask.astype(np.uint8), name='mask')
+    my_widget = binary_morphology_widget()
+
+    # large balls use the distance transform, with the same results as the footprint
+    for method in my_widget.method.choices:
+        fast, _, _ = my_widget(viewer.layers['mask'], method=method, footprint='ball', footprint_size=5)
+        dense, _, _ = my_widget(viewer.layers['mask'], method=method, footprint='ball', footprint_size=5,
+                                decompose=False, distance_transform=False)
+        np.testing.assert_array_equal(fast, dense)
+
+    # distances are measured in physical units for anisotropic layers
+    viewer.layers['mask'].scale = (2, 1, 1)
+    dilated, _, _ = my_widget(viewer.layers['mask'], method='dilation', footprint='ball', footprint_size=2)
+    point = np.zeros((9, 9, 9), bool)
+    point[4, 4, 4] = True
+    dilated_point = distance_morphology('dilation', point, 2, (2, 1, 1))
+    np.testing.assert_array_equal(dilated_point.sum(axis=(1, 2)), [0, 0, 0, 1, 13, 1, 0, 0, 0])
+    np.testing.assert_array_equal(dilated, distance_morphology('dilation', mask, 2, (2, 1, 1)))
+
+def test_binary_morphology_preserve_labels(make_napari_viewer):
+    viewer = make_napari_viewer()
+    labels = np.zeros((60, 60), dtype=np.uint16)
+    labels[5:30, 5:30] = 3
+    labels[5:30, 30:55] = 7
+    labels[35:55, 10:50] = 9
+    viewer.add_labels(labels, name='labels')
+    my_widget = binary_morphology_widget()
+
+    # each label is processed separately and keeps its value
+    for method in ['erosion', 'opening']:
+        out, _, _ = my_widget(viewer.layers['labels'], method=method, footprint='disk',
+                              footprint_size=3, preserve_labels=True)
+        expected = np.zeros_like(labels)
+        for label in [3, 7, 9]:
+            expected[getattr(sm, f'binary_{method}')(labels == label, sm.disk(3))] = label
+        np.testing.assert_array_equal(out, expected)
+
+    # dilated labels stop where they meet
+    out, _, _ = my_widget(viewer.layers['labels'], method='dilation', footprint='disk',
+                          footprint_size=3, preserve_labels=True)
+    assert set(np.unique(out)) == {0, 3, 7, 9}
+    assert np.all(out[labels != 0] == labels[labels != 0])
+
+    with pytest.raises(ValueError):
+        my_widget(viewer.layers['labels'], footprint='square', preserve_labels=True)
+
+def test_thresholding_widget(make_napari_viewer, qtbot):
     viewer = make_napari_viewer()
     random_image = np.random.random((100, 100))
     layer = viewer.add_image(random_image, name='random_image')
@@ -97,9 +556,75 @@ def test_thresholding_widget(make_napari_viewer):
     
     for choice in my_widget.method.choices:
         my_widget.method.native.setCurrentText(choice)
-        my_widget()
+        worker = my_widget()
+        with qtbot.waitSignal(worker.returned):
+            pass
         assert viewer.layers[f'random_image_threshold_{choice}'].data.shape == random_image.shape
 
+def test_thresholding_widget_lazy_data(make_napari_viewer, qtbot):
+    viewer = make_napari_viewer()
+    image = np.random.randint(0, 4096, (8, 60, 60)).astype(np.uint16)
+    viewer.add_image(da.from_array(image, chunks=(2, 30, 30)), name='lazy')
+    my_widget = threshold_widget()
+
+    # thresholds are computed chunk by chunk and the mask is lazy
+    for method in my_widget.method.choices:
+        worker = my_widget(viewer.layers['lazy'], method=method)
+        with qtbot.waitSignal(worker.returned) as blocker:
+            pass
+        mask, _, _ = blocker.args[0]
+        assert isinstance(mask, da.Array)
+        if method == 'sauvola':
+            expected = image > sfw.sf.threshold_sauvola(image)
+        else:
+            expected = image > getattr(sfw.sf, f'threshold_{method}')(image)
+        np.testing.assert_array_equal(mask.compute(), expected)
+
+    # the histogram can be accumulated on a sample of the chunks
+    worker = my_widget(viewer.layers['lazy'], method='otsu', sampled_fraction=0.25)
+    with qtbot.waitSignal(worker.returned) as blocker:
+        pass
+    assert blocker.args[0][0].shape == image.shape
+
+    # in tiles mode, the mask is lazy and the same as for data in memory
+    worker = my_widget(viewer.layers['lazy'], method='otsu', mode='tiles', tile_size=16)
+    with qtbot.waitSignal(worker.returned) as blocker:
+        pass
+    mask, kwargs, _ = blocker.args[0]
+    assert isinstance(mask, da.Array)
+    thresholds = sthw.tile_thresholds(image, 'otsu', 16)
+    np.testing.assert_allclose(kwargs['metadata']['threshold'], thresholds)
+    np.testing.assert_array_equal(mask.compute(),
+                                  image > sthw.interpolate_thresholds(thresholds, image.shape, 16))
+
+def test_thresholding_per_frame_and_tile(make_napari_viewer, qtbot):
+    viewer = make_napari_viewer()
+    image = np.random.random((3, 50, 70)) + np.linspace(0, 2, 70)
+    viewer.add_image(image, name='image')
+    my_widget = threshold_widget()
+
+    # one threshold per frame is stored in the layer metadata
+    worker = my_widget(viewer.layers['image'], method='otsu', process_axis=0)
+    with qtbot.waitSignal(worker.returned):
+        pass
+    qtbot.waitUntil(lambda: 'image_threshold_otsu' in viewer.layers)
+    thresholds = viewer.layers['image_threshold_otsu'].metadata['threshold']
+    np.testing.assert_allclose(thresholds, [sfw.sf.threshold_otsu(frame) for frame in image])
+
+    # in tiles mode, a grid of thresholds is stored for each frame
+    worker = my_widget(viewer.layers['image'], method='otsu', mode='tiles', tile_size=25, process_axis=0)
+    with qtbot.waitSignal(worker.returned) as blocker:
+        pass
+    mask, kwargs, _ = blocker.args[0]
+    assert mask.shape == image.shape
+    assert kwargs['metadata']['threshold'].shape == (3, 2, 3)
+
+    # thresholds are interpolated between tile centers
+    thresholds = np.array([[0., 1.], [2., 3.]])
+    interpolated = sthw.interpolate_thresholds(thresholds, (4, 4), 2)
+    np.testing.assert_allclose(interpolated[[0, 0, -1, -1], [0, -1, 0, -1]], [0, 1, 2, 3])
+    np.testing.assert_allclose(interpolated[1:3, 1:3], [[0.75, 1.25], [1.75, 2.25]])
+
 def test_manual_thresholding_widget(make_napari_viewer):
     viewer = make_napari_viewer()
     random_image = np.random.random((100, 100))
@@ -112,6 +637,44 @@ def test_manual_thresholding_widget(make_napari_viewer):
     my_widget.apply_threshold()
     assert viewer.layers[1].data.shape == random_image.shape
 
+def test_manual_thresholding_live(make_napari_viewer):
+    viewer = make_napari_viewer()
+    image = np.random.random((5, 40, 40))
+    viewer.add_image(image, name='image')
+    my_widget = ManualThresholdWidget(viewer=viewer)
+    my_widget.threshold.max = 1
+    my_widget.threshold.value = 0.5
+
+    # the live mask is lazy and follows the threshold
+    my_widget.live.value = True
+    live = viewer.layers['image_threshold_live']
+    assert isinstance(live.data, da.Array)
+    my_widget.threshold.value = 0.8
+    assert viewer.layers[-1] is live
+    np.testing.assert_array_equal(np.asarray(live.data[2]), image[2] > 0.8)
+
+    # applying the threshold replaces the live mask by the full mask
+    my_widget.apply_threshold()
+    assert 'image_threshold_live' not in viewer.layers
+    np.testing.assert_array_equal(viewer.layers['image_threshold_manual'].data, image > 0.8)
+
+def test_layer_statistics(make_napari_viewer, qtbot):
+    viewer = make_napari_viewer()
+    image = np.random.randint(10, 4000, (20, 50, 50)).astype(np.uint16)
+    layer = viewer.add_image(image)
+
+    # the threshold range is set once the statistics are computed in the background
+    my_widget = ManualThresholdWidget(viewer=viewer)
+    qtbot.waitUntil(lambda: my_widget.threshold.max == image.max())
+    statistics = get_statistics(layer)
+    assert (statistics.min, statistics.max) == (image.min(), image.max())
+    assert statistics.percentile(50) == np.percentile(image, 50, method='inverted_cdf')
+    assert get_statistics(layer) is statistics
+
+    # statistics are recomputed when the data of the layer change
+    layer.data = image // 2
+    assert get_statistics(layer).max == image.max() // 2
+
 def test_simple_maths_widget(make_napari_viewer):
     viewer = make_napari_viewer()
     random_image = np.random.random((100, 100))
@@ -126,6 +689,13 @@ def test_simple_maths_widget(make_napari_viewer):
         filtered, _, _ = my_widget(viewer.layers[0])
         assert filtered.data.shape == random_image.shape
 
+    # small integer inputs keep the numpy result types
+    for dtype, expected in [(np.uint8, np.float16), (np.uint16, np.float32), (np.int32, np.float64)]:
+        layer = viewer.add_image((random_image * 100).astype(dtype))
+        out, _, _ = my_widget(layer, operation='sqrt')
+        assert out.dtype == expected
+        np.testing.assert_allclose(out, np.sqrt(layer.data), rtol=1e-3)
+
 def test_maths_image_pairs_widget(make_napari_viewer):
     viewer = make_napari_viewer()
     random_image = np.random.random((100, 100))
@@ -278,3 +848,43 @@ def test_label_widget_connectivity(make_napari_viewer):
     my_widget.labels_layer.value = layer_2D
     assert my_widget.connectivity.max == 2
     assert my_widget.connectivity.value == 2
+
+def test_label_widget_chunked(make_napari_viewer):
+    viewer = make_napari_viewer()
+    mask = sfw.sf.gaussian(np.random.random((30, 80, 90)), 2) > 0.5
+    viewer.add_labels(mask.astype(np.uint8), name='mask')
+    viewer.add_labels(da.from_array(mask, chunks=(10, 25, 30)), name='lazy')
+    my_widget = label_widget()
+
+    # chunks are labeled separately and merged across chunk boundaries
+    expected, _, _ = my_widget(viewer.layers['mask'], connectivity=3)
+    for layer, chunked in [('mask', True), ('lazy', False)]:
+        labeled, _, _ = my_widget(viewer.layers[layer], connectivity=3, chunked=chunked, chunk_size=16)
+        assert isinstance(labeled[0], da.Array)
+        labeled = labeled[0].compute()
+        assert labeled.max() == expected[0].max()
+        # same regions, possibly numbered in another order
+        pairs = np.unique(np.stack([labeled.ravel(), expected[0].ravel()]), axis=1)
+        assert pairs.shape[1] == expected[0].max() + 1
+
+def test_label_types(make_napari_viewer, qtbot):
+    viewer = make_napari_viewer()
+    mask = np.zeros((40, 600), dtype=np.uint8)
+    mask[::2, ::2] = 1
+    viewer.add_labels(mask, name='mask')
+    viewer.add_image(np.random.random((40, 60)), name='image')
+
+    # labels use the smallest type holding their number, unless chosen
+    labeled, _, _ = label_widget()(viewer.layers['mask'], connectivity=1)
+    assert labeled[0].dtype == np.uint16 and labeled[0].max() == 20 * 300
+    labeled, _, _ = label_widget()(viewer.layers['mask'], connectivity=1, label_type='uint32')
+    assert labeled[0].dtype == np.uint32
+    with pytest.raises(ValueError):
+        label_widget()(viewer.layers['mask'], connectivity=1, label_type='uint8')
+
+    out, _, _ = binary_morphology_widget()(viewer.layers['mask'], method='dilation')
+    assert out.dtype == np.uint8
+    worker = threshold_widget()(viewer.layers['image'])
+    with qtbot.waitSignal(worker.returned) as blocker:
+        pass
+    assert blocker.args[0][0].dtype == np.uint8
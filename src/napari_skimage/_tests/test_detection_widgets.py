@@ -37,3 +37,13 @@ def test_marching_cubes_widget(make_napari_viewer):
     assert vertices.shape[1] == 3  # Ensure vertices are 3D
     assert faces.shape[1] == 3  # Ensure faces are triangles
     assert (faces.dtype == np.int32) | (faces.dtype == np.int64)  # Ensure faces are integer type
+
+def test_detection_widget_ranges(make_napari_viewer, qtbot):
+    viewer = make_napari_viewer()
+    viewer.add_image(np.random.randint(0, 300, (50, 50)).astype(np.uint16) + 100)
+
+    # slider ranges follow the intensity range of the layer
+    my_widget = peak_local_max_widget()
+    qtbot.waitUntil(lambda: my_widget.threshold_absolute.max < 65535)
+    assert my_widget.threshold_absolute.min >= 100
+    assert my_widget.threshold_absolute.max <= 400
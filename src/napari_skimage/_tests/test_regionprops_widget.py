@@ -1,6 +1,13 @@
+from types import SimpleNamespace
+
 import numpy as np
 import pandas as pd
+from skimage.measure import label, regionprops_table
 from skimage.measure._regionprops import _require_intensity_image
+from napari_skimage._label_edits import LabelEdits
+from napari_skimage._regionprops import compute_regionprops_table
+from napari_skimage._table import ResultsTable
+import napari_skimage.skimage_regionprops_widget as regionprops_module
 from napari_skimage.skimage_regionprops_widget import (
     only_2d_properties,
     regionprops_widget,
@@ -67,7 +74,7 @@ def test_regionprops_widget(make_napari_viewer):
         {
             "area": [1.0, 1.0],
             "intensity_mean": [6.0, 7.0],
-            "label": [1.0, 2.0],
+            "label": [1, 2],
         }
     )
     pd.testing.assert_frame_equal(results_df, expected_df)
@@ -239,3 +246,176 @@ def test_analyze_button_state(make_napari_viewer):
     widget.image_layer.value = None
     assert widget.image_layer.value == None
     assert widget.call_button.enabled
+
+
+def test_parallel_regionprops():
+    rng = np.random.default_rng(0)
+    labels = label(rng.random((20, 40, 40)) > 0.7)
+    intensity = rng.random(labels.shape)
+    properties = ["label", "area", "bbox", "centroid", "centroid_weighted",
+                  "intensity_mean", "moments_central", "coords", "slice"]
+
+    # labels are processed in batches on crops, with the same results as skimage
+    expected = regionprops_table(labels, intensity, properties, spacing=(2, 1, 1))
+    results = compute_regionprops_table(labels, intensity, properties, spacing=(2, 1, 1),
+                                        parallel=True, batch_size=50)
+    assert list(results) == list(expected)
+    for key in ["centroid_weighted-0", "centroid_weighted-2", "moments_central-0-1-2"]:
+        np.testing.assert_array_equal(results[key], expected[key])
+    # simple properties are computed for all labels at once, up to rounding
+    for key in ["label", "area", "bbox-0", "bbox-5", "centroid-0", "intensity_mean"]:
+        np.testing.assert_allclose(results[key], expected[key], rtol=1e-12)
+    for coords, expected_coords in zip(results["coords"], expected["coords"]):
+        np.testing.assert_array_equal(coords, expected_coords)
+    assert list(results["slice"]) == list(expected["slice"])
+
+
+def test_vectorized_regionprops():
+    rng = np.random.default_rng(0)
+    labels = label(rng.random((60, 80)) > 0.6)
+    labels[labels == 3] = 0
+    intensity = rng.integers(0, 1000, labels.shape)
+    properties = ["label", "area", "solidity", "bbox", "centroid", "intensity_mean",
+                  "intensity_max", "intensity_min", "intensity_std", "area_bbox"]
+
+    # simple properties are computed for all labels at once and merged with the others
+    expected = regionprops_table(labels, intensity, properties, spacing=(2, 0.5))
+    results = compute_regionprops_table(labels, intensity, properties, spacing=(2, 0.5))
+    assert list(results) == list(expected)
+    for key in expected:
+        np.testing.assert_allclose(results[key], expected[key], rtol=1e-12, err_msg=key)
+
+
+def test_results_table_sort_filter(make_napari_viewer, tmp_path, monkeypatch):
+    viewer = make_napari_viewer()
+    labels = np.zeros((20, 20), dtype=np.uint8)
+    for i, size in enumerate([3, 1, 2]):
+        labels[5 * i:5 * i + size, :size] = i + 1
+    labels_layer = viewer.add_labels(labels)
+
+    widget = regionprops_widget()
+    widget(labels_layer=labels_layer, image_layer=None, properties=["label", "area"])
+    table = widget.results_table
+    assert isinstance(table, ResultsTable)
+    assert table.model.rowCount() == 3
+
+    # sorting and filtering only reorder the rows shown
+    table.model.sort(1)
+    assert list(table.to_dataframe()["label"]) == [2, 3, 1]
+    table.filter.value = "area > 1"
+    assert list(table.to_dataframe()["label"]) == [3, 1]
+    assert table.model.data(table.model.index(0, 1)) == "4"
+    # invalid filters keep the rows shown
+    for expression in ["area >", "unknown > 1"]:
+        table.filter.value = expression
+        assert list(table.to_dataframe()["label"]) == [3, 1]
+    table.filter.value = "area > 1"
+
+    # all results are saved, whatever the filter
+    path = tmp_path / "results.csv"
+    monkeypatch.setattr(regionprops_module.QFileDialog, "getSaveFileName", lambda *args: (str(path), ""))
+    widget.save_button.clicked.emit(True)
+    assert list(pd.read_csv(path)["label"]) == [1, 2, 3]
+
+    # clicking a row selects its label
+    table.view.setCurrentIndex(table.model.index(1, 0))
+    table.view.clicked.emit(table.view.currentIndex())
+    assert labels_layer.selected_label == 1
+
+    # the filter is kept for new results
+    widget(labels_layer=labels_layer, image_layer=None, properties=["area"])
+    assert table.model.rowCount() == 2
+    table.filter.value = ""
+    assert table.model.rowCount() == 3
+
+
+def test_clicked_table_centers_label(make_napari_viewer):
+    viewer = make_napari_viewer()
+    labels = np.zeros((5, 20, 20), dtype=np.uint8)
+    labels[0, 2:4, 2:4] = 3
+    labels[3, 14:17, 10:13] = 7
+    labels_layer = viewer.add_labels(labels, scale=(2, 1, 1))
+
+    # rows are indexed without a label column
+    widget = regionprops_widget()
+    widget(labels_layer=labels_layer, image_layer=None, properties=["area"])
+    np.testing.assert_array_equal(widget._label_index["label"], [3, 7])
+    np.testing.assert_array_equal(widget._label_index["bbox"], [[0, 2, 2, 1, 4, 4], [3, 14, 10, 4, 17, 13]])
+    # without centroid column, the centroid is computed when the row is clicked
+    assert "centroid" not in widget._label_index
+
+    table = widget.results_table
+    table.view.setCurrentIndex(table.model.index(1, 0))
+    table.view.clicked.emit(table.view.currentIndex())
+    assert labels_layer.selected_label == 7
+    assert viewer.dims.current_step[0] == 3
+    np.testing.assert_allclose(viewer.camera.center[-2:], (15, 11))
+
+    # centroids of the table are indexed
+    widget(labels_layer=labels_layer, image_layer=None, properties=["label", "bbox", "centroid"])
+    np.testing.assert_allclose(widget._label_index["centroid"], [[0, 2.5, 2.5], [3, 15, 11]])
+
+
+def test_incremental_regionprops(make_napari_viewer):
+    viewer = make_napari_viewer()
+    rng = np.random.default_rng(0)
+    labels = label(rng.random((60, 60)) > 0.6).astype(np.uint16)
+    intensity = rng.random((60, 60))
+    labels_layer = viewer.add_labels(labels)
+    image_layer = viewer.add_image(intensity, scale=(2, 1))
+    properties = ["label", "area", "bbox", "centroid", "intensity_mean", "solidity"]
+
+    widget = regionprops_widget()
+    widget(labels_layer=labels_layer, image_layer=image_layer, properties=properties)
+
+    def check():
+        expected = compute_regionprops_table(labels_layer.data, intensity, properties, spacing=(2, 1))
+        results = widget.results_table.value
+        assert list(results.columns) == list(expected)
+        for key in expected:
+            np.testing.assert_allclose(results[key], expected[key], rtol=1e-12, err_msg=key)
+        np.testing.assert_array_equal(widget._label_index["label"], expected["label"])
+        # centroids of the index are in pixels
+        np.testing.assert_allclose(widget._label_index["centroid"],
+                                   np.stack([expected["centroid-0"] / 2, expected["centroid-1"]], axis=-1))
+
+    # paint over labels, erase one, fill one with a new label
+    erased = labels_layer.data[10, 10] or 1
+    labels_layer.paint((30, 30), 500)
+    labels_layer.fill(tuple(np.argwhere(labels_layer.data == erased)[0]), 0)
+    labels_layer.data_setitem((np.array([0, 0]), np.array([58, 59])), 3)
+    assert widget._label_edits.valid
+    assert 500 in widget._label_edits.boxes and erased in widget._label_edits.boxes
+
+    edits = widget._label_edits
+    widget(labels_layer=labels_layer, image_layer=image_layer, properties=properties)
+    assert widget._label_edits is edits and edits.boxes == {}
+    check()
+    assert 500 in widget._label_index["label"]
+    assert erased not in widget._label_index["label"]
+
+    # undo cannot be tracked, all properties are recomputed
+    labels_layer.paint((5, 50), 600)
+    labels_layer.undo()
+    assert not widget._label_edits.valid
+    widget(labels_layer=labels_layer, image_layer=image_layer, properties=properties)
+    check()
+
+
+def test_label_edits_boxes(make_napari_viewer):
+    viewer = make_napari_viewer()
+    labels_layer = viewer.add_labels(np.zeros((30, 30), dtype=np.uint8))
+    edits = LabelEdits(labels_layer)
+
+    labels_layer.data_setitem((np.array([0]), np.array([0])), 1)
+    labels_layer.data_setitem((np.array([10]), np.array([10])), 1)
+    # boxes of labels edited together only grow with their own edits
+    labels_layer.data_setitem((np.array([10, 20]), np.array([10, 20])), 2)
+    np.testing.assert_array_equal(edits.boxes[1], [[0, 0], [21, 21]])
+    np.testing.assert_array_equal(edits.boxes[2], [[10, 10], [21, 21]])
+
+    # edits changing no pixel are ignored
+    empty = (np.array([], dtype=int), np.array([], dtype=int))
+    edits._on_paint(SimpleNamespace(value=[(empty, np.array([]), np.array([]))]))
+    assert set(edits.boxes) == {1, 2}
+    edits.disconnect()
@@ -0,0 +1,94 @@
+"""
+Tiled processing of lazy (dask, zarr) layers. Instead of loading the full array in
+memory, the filter is applied to each chunk extended by a halo (overlap) large enough
+to contain the filter kernel, so that the tiled result is identical to the result
+on the full array. Chunks are processed in parallel by dask and the output is a
+lazy dask array, only computed when napari displays it or when it is saved.
+"""
+
+import dask.array as da
+import numpy as np
+
+
+def is_lazy(data):
+    """Check whether data is a lazy array that should not be loaded at once."""
+    return not isinstance(data, np.ndarray)
+
+
+def as_dask(data):
+    """Wrap data in a dask array, using its own chunks if it has any (e.g. zarr)."""
+    if isinstance(data, da.Array):
+        return data
+    return da.from_array(data, chunks=getattr(data, 'chunks', 'auto'))
+
+
+def gaussian_depth(sigma, truncate=4.0):
+    """Halo size of a Gaussian kernel (see scipy.ndimage.gaussian_filter)."""
+    return int(truncate * np.max(sigma) + 0.5)
+
+
+def tile_boundary(mode):
+    """Boundary of the tiles at the edges of the array matching the mode of a filter.
+
+    Edge tiles have no halo ('none') and are padded by the filter itself,
+    except for 'wrap' where the halo is taken from the opposite edge.
+    """
+    return 'periodic' if mode == 'wrap' else 'none'
+
+
+def footprint_depth(footprint):
+    """Halo size of a footprint along each of its axes."""
+    return tuple(int(s) // 2 for s in footprint.shape)
+
+
+def apply_planes(func, block, plane_ndim):
+    """Apply func to each plane made of the last plane_ndim axes of block.
+
+    If func returns a tuple of arrays, a tuple of stacked arrays is returned.
+    """
+    leading_shape = block.shape[:block.ndim - plane_ndim]
+    out = [func(block[index]) for index in np.ndindex(leading_shape)]
+    if isinstance(out[0], tuple):
+        return tuple(np.stack(o).reshape(leading_shape + o[0].shape) for o in zip(*out))
+    return np.stack(out).reshape(leading_shape + out[0].shape)
+
+
+def map_tiles(func, data, depth, plane_ndim=None, boundary='none'):
+    """Apply func lazily to the overlapping tiles of data.
+
+    Parameters
+    ----------
+    func : callable
+        Function taking an array and returning an array of the same shape.
+    data : array-like
+        Data to process. Dask arrays keep their chunks, other arrays (e.g. zarr)
+        are wrapped with their own chunks if they have any.
+    depth : int or tuple of int
+        Halo size, either for all axes or for each axis processed by func.
+    plane_ndim : int, optional
+        If given, func is applied independently to each plane made of the last
+        plane_ndim axes and the halo along the leading axes is 0.
+    boundary : str
+        Boundary of the tiles at the edges of the array, see tile_boundary.
+
+    Returns
+    -------
+    out : dask.array.Array
+    """
+    data = as_dask(data)
+
+    ndim = data.ndim if plane_ndim is None else min(plane_ndim, data.ndim)
+    if np.isscalar(depth):
+        depth = (depth,) * ndim
+    depth = (0,) * (data.ndim - ndim) + tuple(depth)[-ndim:]
+    # axes made of a single chunk need no halo, which can't be larger than the axis
+    depth = tuple(0 if n_blocks == 1 else min(d, size)
+                  for d, size, n_blocks in zip(depth, data.shape, data.numblocks))
+
+    block_func = func
+    if data.ndim > ndim:
+        def block_func(block):
+            return apply_planes(func, block, ndim)
+
+    dtype = block_func(np.zeros((1,) * (data.ndim - ndim) + (3,) * ndim, dtype=data.dtype)).dtype
+    return data.map_overlap(block_func, depth=depth, boundary=boundary, dtype=dtype)
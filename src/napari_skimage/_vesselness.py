@@ -0,0 +1,101 @@
+"""
+Multi-scale Frangi vesselness reusing the Hessian scale-space. The eigenvalues of the
+Hessian at each scale are the expensive part of the filter and only depend on the image,
+the scale and the boundary mode: they are stored in the shared result cache so that
+changing the ridge polarity, the filter constants or narrowing the scale range does not
+recompute them. The result is the same as skimage.filters.frangi, and the scale giving
+the maximal response at each pixel can be returned as well.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from skimage.feature import hessian_matrix, hessian_matrix_eigvals
+
+from ._cache import fingerprint, result_cache
+
+
+def hessian_eigenvalues(image, sigma, mode='reflect', cval=0, image_key=None):
+    """Eigenvalues of the Hessian of image at scale sigma, sorted by magnitude.
+
+    Eigenvalues are cached by image_key (the fingerprint of image by default),
+    sigma, mode and cval if they fit in the cache.
+    """
+    key = None
+    if result_cache.fits(image.ndim * image.nbytes):
+        if image_key is None:
+            image_key = fingerprint(image)
+        key = ('hessian_eigenvalues', image_key, float(sigma), mode, cval)
+    eigvals = result_cache.get(key)
+    if eigvals is None:
+        eigvals = hessian_matrix_eigvals(hessian_matrix(
+            image, sigma, mode=mode, cval=cval, use_gaussian_derivatives=True))
+        eigvals = np.take_along_axis(eigvals, abs(eigvals).argsort(0), 0)
+        result_cache.put(key, eigvals)
+    return eigvals
+
+
+def vesselness(eigvals, alpha, beta, gamma):
+    """Frangi vesselness at one scale from eigenvalues sorted by magnitude (black ridges)."""
+    dtype = eigvals.dtype
+    lambda1 = eigvals[0]
+    if len(eigvals) == 2:
+        (lambda2,) = np.maximum(eigvals[1:], 1e-10)
+        r_a = np.inf
+        r_b = abs(lambda1) / lambda2
+    else:
+        lambda2, lambda3 = np.maximum(eigvals[1:], 1e-10)
+        r_a = lambda2 / lambda3
+        r_b = abs(lambda1) / np.sqrt(lambda2 * lambda3)
+    s = np.sqrt((eigvals**2).sum(0))
+    vals = 1.0 - np.exp(-(r_a**2) / (2 * alpha**2), dtype=dtype)
+    vals *= np.exp(-(r_b**2) / (2 * beta**2), dtype=dtype)
+    vals *= 1.0 - np.exp(-(s**2) / (2 * gamma**2), dtype=dtype)
+    return vals
+
+
+def frangi(image, sigmas=range(1, 10, 2), alpha=0.5, beta=0.5, gamma=None,
+           black_ridges=True, mode='reflect', cval=0, workers=1, return_scale=False):
+    """Frangi vesselness filter of a 2D or 3D image, see skimage.filters.frangi.
+
+    Parameters
+    ----------
+    workers : int
+        Number of threads computing the Hessian at different scales in parallel.
+    return_scale : bool
+        If True, also return the scale giving the maximal response at each pixel
+        (0 where the response is 0 at all scales).
+
+    Returns
+    -------
+    out : ndarray or tuple of ndarray
+        Vesselness, and scale map if return_scale is True.
+    """
+    image = np.asarray(image)
+    if image.ndim not in (2, 3):
+        raise ValueError(f'The Frangi filter requires a 2D or 3D image, got {image.ndim}D.')
+    image = image.astype(np.float32 if image.dtype in (np.float16, np.float32) else np.float64,
+                         copy=False)
+    image_key = fingerprint(image) if result_cache.fits(image.ndim * image.nbytes) else None
+
+    def eigenvalues(sigma):
+        return hessian_eigenvalues(image, sigma, mode=mode, cval=cval, image_key=image_key)
+
+    filtered_max = np.zeros_like(image)
+    scale = np.zeros_like(image) if return_scale else None
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        for sigma, eigvals in zip(sigmas, executor.map(eigenvalues, sigmas)):
+            # the eigenvalues of -image are the opposite, sorted in the same order
+            if not black_ridges:
+                eigvals = -eigvals
+            if gamma is None:
+                gamma = np.sqrt((eigvals**2).sum(0)).max() / 2
+                if gamma == 0:
+                    gamma = 1
+            vals = vesselness(eigvals, alpha, beta, gamma)
+            if return_scale:
+                scale[vals > filtered_max] = sigma
+            filtered_max = np.maximum(filtered_max, vals)
+    if return_scale:
+        return filtered_max, scale
+    return filtered_max
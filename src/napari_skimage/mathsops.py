@@ -7,6 +7,8 @@ import skimage.util
 from napari.layers import Image, Labels, Layer, Shapes
 import napari.types
 
+from ._execution import PRECISION, float_dtype
+
 
 if TYPE_CHECKING:
     import napari
@@ -14,16 +16,24 @@ if TYPE_CHECKING:
 @magic_factory(
         image_layer={'label': 'Image'},
         operation={'choices': ['square', 'sqrt', 'log', 'log10', 'exp']},
+        precision=PRECISION,
         call_button="Apply operation"
         )
 def simple_maths_widget(
-    image_layer: Image, operation='sqrt'
+    image_layer: Image, operation='sqrt', precision='auto'
 ) -> napari.types.LayerDataTuple:
     if operation == 'square':
-        fun = lambda x: x.astype(np.float32)**2
+        fun = np.square
     else:
         fun = getattr(np, f'{operation}')
-    out = fun(image_layer.data)
+    dtype = float_dtype(image_layer.data, precision)
+    if precision == 'auto':
+        # keep the narrower result types of numpy for small integers (e.g. float16 for uint8)
+        default = fun(np.ones(1, dtype=image_layer.data.dtype)).dtype
+        if np.issubdtype(default, np.floating) and default.itemsize < np.dtype(dtype).itemsize:
+            dtype = default
+    # the input is cast while computing, so that only the result is allocated
+    out = fun(image_layer.data, dtype=dtype)
     return (
         out,
         {'name': f'{image_layer.name}_{operation}'},
@@ -33,23 +43,23 @@ def simple_maths_widget(
         data_layer={'label': 'Image'},
         data_layer2={'label': 'Image 2'},
         operation={'choices': ['add', 'subtract', 'multiply', 'divide']},
+        precision=PRECISION,
         call_button="Apply operation"
         )
 def maths_image_pairs_widget(
     data_layer: Layer,
     data_layer2: Layer,
-    operation='add'
+    operation='add',
+    precision='auto'
 ) -> napari.types.LayerDataTuple:
     if not isinstance(data_layer, (Labels, Image)) or not isinstance(data_layer2, (Labels, Image)):
         raise ValueError("Both layers must be Image or Labels layers")
-    if operation == 'add':
-        out = data_layer.data + data_layer2.data
-    elif operation == 'subtract':
-        out = data_layer.data - data_layer2.data
-    elif operation == 'multiply':
-        out = data_layer.data * data_layer2.data
-    elif operation == 'divide':
-        out = data_layer.data / data_layer2.data
+    # integer results keep their type, floating point results have the chosen precision
+    dtype = None
+    if operation == 'divide' or np.issubdtype(np.result_type(data_layer.data, data_layer2.data), np.floating):
+        dtype = float_dtype(data_layer.data, precision)
+    fun = getattr(np, operation)
+    out = fun(data_layer.data, data_layer2.data, dtype=dtype)
     return (
         out,
         {'name': f'Result_{operation}'},
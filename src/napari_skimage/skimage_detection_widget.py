@@ -8,11 +8,14 @@ from skimage.measure import marching_cubes
 from napari.layers import Image, Labels
 import napari.types
 
+from ._stats import connect_value_ranges
+
 if TYPE_CHECKING:
     import napari
 
 
 def _on_init_peak_local_max(widget):
+    connect_value_ranges(widget.image_layer, [widget.threshold_absolute])
     label_widget = Label(value='')
     func_name = '_'.join(widget.label.split(' ')[:-1])
     label_widget.value = f'<a href=\"https://scikit-image.org/docs/stable/api/skimage.feature.html#skimage.feature.{func_name}\">skimage.feature.{func_name}</a>'
@@ -23,6 +26,9 @@ def _on_init_peak_local_max(widget):
 
 
 def _on_init_marching_cubes(widget):
+    # the labels version has no level to choose
+    if getattr(widget, 'level', None) is not None:
+        connect_value_ranges(widget.image_layer, [widget.level])
     label_widget = Label(value='')
     label_widget.value = '<a href=\"https://scikit-image.org/docs/stable/api/skimage.measure.html#skimage.measure.marching_cubes\">skimage.measure.marching_cubes</a>'
     label_widget.native.setTextFormat(Qt.RichText)
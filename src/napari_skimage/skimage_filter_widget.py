@@ -1,4 +1,6 @@
-from typing import TYPE_CHECKING
+import os
+from functools import partial
+from typing import TYPE_CHECKING, List, Optional
 
 import numpy as np
 from magicgui import magic_factory
@@ -7,8 +9,19 @@ from qtpy.QtCore import Qt
 import skimage.filters as sf
 import skimage.morphology as sm
 from napari.layers import Image
+from napari.qt.threading import FunctionWorker
 import napari.types
 
+from ._execution import (PRECISION, PROCESS_AXIS, add_cancel_button, connect_axis_choices,
+                         run_in_worker, with_precision)
+from ._fft import butterworth
+from ._preview import add_preview
+from ._rank import (PERCENTILE_STATS, binned_rank_filter, median, rank_filter,
+                    sequential_rank_filters)
+from ._stats import request_statistics
+from ._tiling import footprint_depth, gaussian_depth, tile_boundary
+from ._vesselness import frangi
+
 
 if TYPE_CHECKING:
     import napari
@@ -18,9 +31,28 @@ documentation of the function that the widget is calling. For this to work prope
 to be named "<skimage function name>_filter_widget".
 
 RankFilterWidget is a class that defines a widget for rank filters. The widget can be used for all rank filters.
+
+All filters are run in a background thread via the shared execution layer of the _execution module. Filters
+using a footprint with fewer dimensions than the image are applied plane by plane. Filters with a known
+kernel size (Gaussian, edge filters, median) pass it as halo size so that lazy (dask, zarr) layers are
+processed tile by tile without being loaded in memory. The "Process along axis" option applies the filter
+independently to each frame along the chosen axis (e.g. time), in parallel. The "Preview" option of the
+magic_factory filters shows the result for the visible region of the displayed slice while tuning parameters.
+Global filters (Frangi, Butterworth), whose result depends on the whole image, have no preview.
+Filters returning floating point images have a "Precision" option (float32 by default for large inputs).
+The Frangi filter uses the engine of the _vesselness module which caches the Hessian at each scale, and the
+Butterworth filter the engine of the _fft module which caches its frequency mask.
+Median and rank filters with large footprints use the faster engines of the _rank module. With the
+"Histogram bins" option, rank filters are applied to the image quantized into fewer bins. Several statistics
+can be computed in one run with "Additional statistics", giving one layer per statistic; each statistic is
+still a separate rank filter pass over the image.
 """
 
-def _on_init(widget):
+def _init_filter(widget, preview=True):
+    add_cancel_button(widget)
+    connect_axis_choices(widget[0], widget.process_axis)
+    if preview:
+        add_preview(widget)
     label_widget = Label(value='')
     func_name = widget.label.split(' ')[0]
     label_widget.value = f'<a href=\"https://scikit-image.org/docs/stable/api/skimage.filters.html#skimage.filters.{func_name}\">skimage.filters.{func_name}</a>'
@@ -29,48 +61,76 @@ def _on_init(widget):
     label_widget.native.setOpenExternalLinks(True)
     widget.extend([label_widget])
 
+def _on_init(widget):
+    _init_filter(widget)
+
+def _global_on_init(widget):
+    # the result of global filters (Frangi, Butterworth) depends on the whole image,
+    # so that it cannot be previewed on the visible region
+    _init_filter(widget, preview=False)
+
 @magic_factory(
         image_layer={'label': 'Image'},
         mode={'choices': ['reflect', 'constant', 'nearest', 'mirror', 'wrap']},
+        process_axis=PROCESS_AXIS,
+        precision=PRECISION,
         call_button="Apply Farid filter",
         widget_init=_on_init
         )
 def farid_filter_widget(
-    image_layer: Image, mode: str ='reflect') -> napari.types.LayerDataTuple:
-    return (
-        sf.farid(image_layer.data, mode=mode),
+    image_layer: Image, mode: str ='reflect', precision: str = 'auto',
+    process_axis: Optional[int] = None) -> FunctionWorker[napari.types.LayerDataTuple]:
+    return run_in_worker(
+        with_precision(partial(sf.farid, mode=mode), image_layer.data, precision, rescale=True),
+        image_layer.data,
         {'name': f'{image_layer.name}_farid'},
-        'image')
+        depth=2,
+        boundary=tile_boundary(mode),
+        axis=process_axis)
 
 @magic_factory(
         image_layer={'label': 'Image'},
         mode={'choices': ['reflect', 'constant', 'nearest', 'mirror', 'wrap']},
+        process_axis=PROCESS_AXIS,
+        precision=PRECISION,
         call_button="Apply Prewitt filter",
         widget_init=_on_init
         )
 def prewitt_filter_widget(
-    image_layer: Image, mode: str ='reflect') -> napari.types.LayerDataTuple:
-    return (
-        sf.prewitt(image_layer.data, mode=mode),
+    image_layer: Image, mode: str ='reflect', precision: str = 'auto',
+    process_axis: Optional[int] = None) -> FunctionWorker[napari.types.LayerDataTuple]:
+    return run_in_worker(
+        with_precision(partial(sf.prewitt, mode=mode), image_layer.data, precision, rescale=True),
+        image_layer.data,
         {'name': f'{image_layer.name}_prewitt'},
-        'image')
+        depth=1,
+        boundary=tile_boundary(mode),
+        axis=process_axis)
 
 @magic_factory(
         image_layer={'label': 'Image'},
+        process_axis=PROCESS_AXIS,
+        precision=PRECISION,
         call_button="Apply Laplace filter",
         widget_init=_on_init
         )
 def laplace_filter_widget(
     image_layer: Image,
-    ksize: int = 3.0) -> napari.types.LayerDataTuple:
-    return (
-        sf.laplace(image_layer.data, ksize=ksize),
+    ksize: int = 3.0,
+    precision: str = 'auto',
+    process_axis: Optional[int] = None) -> FunctionWorker[napari.types.LayerDataTuple]:
+    return run_in_worker(
+        with_precision(partial(sf.laplace, ksize=ksize), image_layer.data, precision, rescale=True),
+        image_layer.data,
         {'name': f'{image_layer.name}_laplace'},
-        'image')
+        depth=ksize // 2,
+        axis=process_axis)
 
 @magic_factory(
         img_layer={'label': 'Image'},
         mode={'choices': ['reflect', 'constant', 'nearest', 'mirror', 'wrap']},
+        process_axis=PROCESS_AXIS,
+        precision=PRECISION,
         call_button="Apply Gaussian Filter",
         widget_init=_on_init
         )
@@ -79,17 +139,25 @@ def gaussian_filter_widget(
     sigma: float = 1.0,
     preserve_range: bool = False,
     mode: str = "reflect",
-) -> napari.types.LayerDataTuple:
-    return (
-        sf.gaussian(img_layer.data, sigma=sigma, preserve_range=preserve_range, mode=mode),
+    precision: str = 'auto',
+    process_axis: Optional[int] = None,
+) -> FunctionWorker[napari.types.LayerDataTuple]:
+    return run_in_worker(
+        with_precision(partial(sf.gaussian, sigma=sigma, preserve_range=preserve_range, mode=mode),
+                       img_layer.data, precision, rescale=not preserve_range),
+        img_layer.data,
         {'name': f'{img_layer.name}_gaussian_σ={sigma}'},
-        'image')
+        depth=gaussian_depth(sigma),
+        boundary=tile_boundary(mode),
+        axis=process_axis)
 
 @magic_factory(
         img_layer={'label': 'Image'},
         mode={'choices': ['reflect', 'constant', 'nearest', 'mirror', 'wrap']},
+        process_axis=PROCESS_AXIS,
+        precision=PRECISION,
         call_button="Apply Frangi Filter",
-        widget_init=_on_init
+        widget_init=_global_on_init
         )
 def frangi_filter_widget(
     img_layer: Image,
@@ -98,18 +166,30 @@ def frangi_filter_widget(
     scale_step: float = 2.0,
     mode: str = "reflect",
     black_ridges: bool = True,
-) -> napari.types.LayerDataTuple:
-    return (
-        sf.frangi(img_layer.data, sigmas=np.arange(scale_start, scale_end, scale_step),
-                  black_ridges=black_ridges, mode=mode),
-        {'name': f'{img_layer.name}_frangi'},
-        'image')
+    scale_map: bool = False,
+    parallel_scales: bool = False,
+    precision: str = 'auto',
+    process_axis: Optional[int] = None,
+) -> FunctionWorker[List[napari.types.LayerDataTuple]]:
+    layer_kwargs = {'name': f'{img_layer.name}_frangi'}
+    if scale_map:
+        layer_kwargs = [layer_kwargs, {'name': f'{img_layer.name}_frangi_scale', 'colormap': 'viridis'}]
+    return run_in_worker(
+        with_precision(partial(frangi, sigmas=np.arange(scale_start, scale_end, scale_step),
+                               black_ridges=black_ridges, mode=mode,
+                               workers=os.cpu_count() if parallel_scales else 1,
+                               return_scale=scale_map),
+                       img_layer.data, precision),
+        img_layer.data,
+        layer_kwargs,
+        axis=process_axis)
 
 @magic_factory(
     img_layer={'label': 'Image'},
     mode={'choices': {'reflect', 'constant', 'nearest', 'mirror', 'wrap'}},
     footprint={'label': 'Footprint', 'choices': ['disk', 'square', 'diamond', 'star', 'octagon']},
     footprint_size={'label': 'Footprint size', 'max': 100, 'min': 1, 'step': 1},
+    process_axis=PROCESS_AXIS,
     call_button="Apply operation",
     widget_init=_on_init
 )
@@ -117,20 +197,26 @@ def median_filter_widget(
     img_layer: Image,
     footprint: str = "disk",
     footprint_size: int = 3,
-    mode: str = "nearest"
-) -> napari.types.LayerDataTuple:
+    mode: str = "nearest",
+    process_axis: Optional[int] = None,
+) -> FunctionWorker[napari.types.LayerDataTuple]:
     fun_footprint = getattr(sm, footprint)
     selem = fun_footprint(footprint_size)
-    img_filtered = sf.median(img_layer.data, footprint=selem, mode=mode)
-    return (
-        img_filtered,
+    return run_in_worker(
+        partial(median, footprint=selem, mode=mode),
+        img_layer.data,
         {'name': f'{img_layer.name}_median'},
-        'image')
+        plane_ndim=selem.ndim,
+        depth=footprint_depth(selem),
+        boundary=tile_boundary(mode),
+        axis=process_axis)
 
 @magic_factory(
     img_layer={'label': 'Image'},
+    precision=PRECISION,
+    process_axis=PROCESS_AXIS,
     call_button="Apply operation",
-    widget_init=_on_init
+    widget_init=_global_on_init
 )
 def butterworth_filter_widget(
     img_layer: Image,
@@ -139,15 +225,19 @@ def butterworth_filter_widget(
     order: int = 2,
     squared_butterworth: bool = True,
     npad: int = 0,
-) -> napari.types.LayerDataTuple:
-    img_filtered = sf.butterworth(
-        img_layer.data, cutoff_frequency_ratio=cuttoff_frequency_ratio,
-        high_pass=high_pass, order=order, squared_butterworth=squared_butterworth,
-        npad=npad)
-    return (
-        img_filtered,
+    parallel_fft: bool = False,
+    precision: str = 'auto',
+    process_axis: Optional[int] = None,
+) -> FunctionWorker[napari.types.LayerDataTuple]:
+    return run_in_worker(
+        with_precision(partial(butterworth, cutoff_frequency_ratio=cuttoff_frequency_ratio,
+                               high_pass=high_pass, order=order,
+                               squared_butterworth=squared_butterworth, npad=npad,
+                               workers=os.cpu_count() if parallel_fft else 1),
+                       img_layer.data, precision),
+        img_layer.data,
         {'name': f'{img_layer.name}_butterworth'},
-        'image')
+        axis=process_axis)
 
 class RankFilterWidget(Container):
     def __init__(self, viewer: "napari.viewer.Viewer"):
@@ -169,6 +259,10 @@ class RankFilterWidget(Container):
                                 'autolevel_percentile']}
         )
 
+        self.more_stats = create_widget(
+            label="Additional statistics", annotation=List[str], widget_type="Select",
+            options={'choices': list(dict.fromkeys(self.stat.choices)), 'value': []})
+
         self.footprint = create_widget(
             label="Footprint", annotation=str, widget_type="ComboBox",
             options={'choices':['disk', 'square', 'diamond', 'star', 'octagon']}
@@ -177,6 +271,16 @@ class RankFilterWidget(Container):
         self.footprint_size = create_widget(
             label="Footprint size", annotation=int, options={'value': 3})
 
+        self.n_bins = create_widget(
+            label="Histogram bins", annotation=Optional[int], widget_type="ComboBox",
+            options={'choices': [('none', None), ('64', 64), ('256', 256), ('1024', 1024), ('4096', 4096)],
+                     'nullable': False,
+                     'tooltip': 'Quantize the image into fewer bins: faster but less accurate rank filters'})
+
+        self.process_axis = create_widget(
+            label="Process along axis", annotation=Optional[int], widget_type="ComboBox",
+            options={'choices': [('none', None)], 'nullable': False})
+
         self.percentile =create_widget(
             label="Percentile", widget_type='FloatRangeSlider',
             options={'value':[0.1, 0.99], 'min': 0, 'max': 1, 'step': 0.01})
@@ -184,6 +288,10 @@ class RankFilterWidget(Container):
         self.btn_apply = Button(text="Apply operation")
         self.btn_apply.clicked.connect(self._rank_filter_im)
 
+        self._worker = None
+        self.btn_cancel = Button(text="Cancel", enabled=False)
+        self.btn_cancel.clicked.connect(self._cancel)
+
         self.link_label = Label(value='')
         self.link_label.native.setTextFormat(Qt.RichText)
         self.link_label.native.setTextInteractionFlags(Qt.TextBrowserInteraction)
@@ -194,19 +302,26 @@ class RankFilterWidget(Container):
             [
                 self._image_layer_combo,
                 self.stat,
+                self.more_stats,
                 self.footprint,
                 self.footprint_size,
+                self.n_bins,
+                self.process_axis,
                 self.btn_apply,
+                self.btn_cancel,
                 self.link_label
             ]
         )
 
         self.stat.changed.connect(self._on_choose_stat)
+        self.more_stats.changed.connect(self._on_choose_stat)
         self._on_choose_stat()
+        connect_axis_choices(self._image_layer_combo, self.process_axis)
+        self._image_layer_combo.changed.connect(self._request_statistics)
+        self.n_bins.changed.connect(self._request_statistics)
 
     def _on_choose_stat(self, event=None):
-        if self.stat.value in ['mean_percentile', 'subtract_mean_percentile', 'sum_percentile',
-                                'gradient_percentile', 'enhance_contrast_percentile', 'autolevel_percentile']:
+        if any(stat in PERCENTILE_STATS for stat in [self.stat.value] + self.more_stats.value):
             if self.percentile not in self:
                 self.extend([self.percentile])
         else:
@@ -216,22 +331,63 @@ class RankFilterWidget(Container):
         self.link_label.value = f'<a href=\"https://scikit-image.org/docs/stable/api/skimage.filters.rank.html#skimage.filters.rank.{self.stat.value}\">skimage.filters.rank.{self.stat.value}</a>'
         
 
+    def _request_statistics(self, event=None):
+        # statistics used for binning are computed in the background as soon as bins are chosen
+        image_layer = self._image_layer_combo.value
+        if image_layer is not None and self.n_bins.value is not None:
+            request_statistics(image_layer, lambda statistics: None)
+
     def _rank_filter_im(self):
         image_layer = self._image_layer_combo.value
         if image_layer is None:
             return
+        if self.n_bins.value is None:
+            return self._run_rank_filter(image_layer)
+
+        # the range is taken over the whole layer so that all planes are binned alike,
+        # the filter starts once its statistics are computed (in the background)
+        self._worker = None
+        request_statistics(image_layer, partial(self._run_rank_filter, image_layer))
+        return self._worker
 
+    def _run_rank_filter(self, image_layer, statistics=None):
+        stats = [self.stat.value] + [stat for stat in self.more_stats.value if stat != self.stat.value]
         kwargs = {}
-        if self.stat.value in ['mean_percentile', 'subtract_mean_percentile', 'sum_percentile',
-                                'gradient_percentile', 'enhance_contrast_percentile', 'autolevel_percentile']:
-            kwargs = {'p0': self.percentile.value[0], 'p1': self.percentile.value[1]}          
+        if any(stat in PERCENTILE_STATS for stat in stats):
+            kwargs = {'p0': self.percentile.value[0], 'p1': self.percentile.value[1]}
+
+        bins = {}
+        if statistics is not None:
+            bins = {'n_bins': self.n_bins.value,
+                    'low': float(statistics.min), 'high': float(statistics.max)}
 
-        fun = getattr(sf.rank, self.stat.value)
         fun_footprint = getattr(sm, self.footprint.value)
         selem = fun_footprint(self.footprint_size.value)
-        img_filtered = fun(image_layer.data, footprint=selem, **kwargs)
-        self._viewer.add_image(
-            img_filtered,
-            name=f"{image_layer.name}_{self.stat.value}",
-            colormap="gray",
+        layer_kwargs = [{'name': f"{image_layer.name}_{stat}", 'colormap': "gray"} for stat in stats]
+        if len(stats) > 1:
+            fun = partial(sequential_rank_filters, stats, footprint=selem, **bins, **kwargs)
+        elif bins:
+            fun = partial(binned_rank_filter, stats[0], footprint=selem, **bins, **kwargs)
+            layer_kwargs = layer_kwargs[0]
+        else:
+            fun = partial(rank_filter, stats[0], footprint=selem, **kwargs)
+            layer_kwargs = layer_kwargs[0]
+        self._worker = run_in_worker(
+            fun,
+            image_layer.data,
+            layer_kwargs,
+            plane_ndim=selem.ndim,
+            axis=self.process_axis.value,
+            connect={'returned': self._on_rank_filter_done,
+                     'finished': lambda: setattr(self.btn_cancel, 'enabled', False)},
         )
+        self.btn_cancel.enabled = True
+        return self._worker
+
+    def _on_rank_filter_done(self, layer_data):
+        for img_filtered, layer_kwargs, _ in (layer_data if isinstance(layer_data, list) else [layer_data]):
+            self._viewer.add_image(img_filtered, **layer_kwargs)
+
+    def _cancel(self, event=None):
+        if self._worker is not None:
+            self._worker.quit()
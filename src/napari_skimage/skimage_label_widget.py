@@ -8,10 +8,22 @@ from napari.utils.notifications import show_info
 from qtpy.QtCore import Qt
 from skimage.measure import label
 
+from ._labeling import LABEL_TYPE, as_labels, chunked_label
+from ._tiling import is_lazy
+
 if TYPE_CHECKING:
     import napari
     from magicgui.widgets import Widget
 
+"""
+Connected components are labeled with skimage.measure.label. Lazy (dask, zarr) layers,
+and other layers if "Label by chunks" is checked, are labeled chunk by chunk in
+parallel and the labels of neighbouring chunks are merged (see _labeling): the result
+is a lazy array, so that neither the data nor the labels are loaded at once. Labels are
+stored with the smallest unsigned integer type holding their number, unless a
+"Label type" is chosen.
+"""
+
 
 def _on_init_label(widget: "Widget") -> None:
     label_widget = Label(value="")
@@ -40,6 +52,9 @@ def _on_init_label(widget: "Widget") -> None:
 @magic_factory(
     labels_layer={"label": "Labels Layer"},
     connectivity={"label": "Connectivity", "min": 1, "step": 1},
+    chunked={"label": "Label by chunks"},
+    chunk_size={"label": "Chunk size", "min": 16, "max": 4096},
+    label_type=LABEL_TYPE,
     call_button="Label connected components",
     widget_init=_on_init_label,
 )
@@ -47,13 +62,27 @@ def label_widget(
     labels_layer: Labels,
     connectivity: int = 1,
     background: int = 0,
+    chunked: bool = False,
+    chunk_size: int = 256,
+    label_type: str = 'auto',
 ) -> napari.types.LayerDataTuple:
-    labeled_array, number = label(
-        labels_layer.data,
-        connectivity=connectivity,
-        background=background,
-        return_num=True,
-    )
+    if is_lazy(labels_layer.data) or chunked:
+        labeled_array, number = chunked_label(
+            labels_layer.data,
+            connectivity=connectivity,
+            background=background,
+            # lazy data keep their own chunks
+            chunks=chunk_size if chunked else None,
+            dtype=label_type,
+        )
+    else:
+        labeled_array, number = label(
+            labels_layer.data,
+            connectivity=connectivity,
+            background=background,
+            return_num=True,
+        )
+        labeled_array = as_labels(labeled_array, number, label_type)
     show_info(f"Labeled {number} regions")
     return (
         (labeled_array,),
@@ -7,6 +7,10 @@ import skimage.morphology as sm
 from napari.layers import Image, Labels
 import napari.types
 
+from ._distance import (DISTANCE_TRANSFORM_RADIUS, distance_morphology, label_morphology,
+                        pixel_sampling)
+from ._footprints import footprint_ndim, get_footprint
+from ._labeling import LABEL_TYPE, as_labels
 
 if TYPE_CHECKING:
     import napari
@@ -15,6 +19,12 @@ if TYPE_CHECKING:
 images. Options are provided to define the footprint shape and size. Links to skimage documentation are
 provided via the _on_init function which first checks if the widget is for binary or grey scale images
 and then creates the appropriate link.
+Footprints are cached and large footprints are decomposed into sequences of small ones, which is much faster
+(see _footprints). Balls are only decomposed with "Approximate large balls", as their decomposition is not exact:
+by default, grey scale operations with large balls are therefore not accelerated.
+Binary operations with large disks and balls, or on anisotropic layers, are computed from distance transforms
+instead (see _distance). With "Preserve labels", each label is processed separately
+while keeping its value, in a single pass over the image.
 """
 
 def _on_init(widget):
@@ -42,6 +52,11 @@ def _on_init(widget):
     footprint={'label': 'Footprint', 'choices': ['disk', 'square',
                                                  'diamond', 'star', 'octagon', 'ball', 'cube']},
     footprint_size={'label': 'Footprint size', 'max': 100, 'min': 1, 'step': 1},
+    decompose={'label': 'Decompose large footprints'},
+    approximate_balls={'label': 'Approximate large balls (faster)'},
+    distance_transform={'label': 'Distance transform for large disks and balls'},
+    preserve_labels={'label': 'Preserve labels (disk, ball)'},
+    label_type=LABEL_TYPE,
     # to add for skimage 0.23
     #mode = {'choices': ['min', 'max', 'ignore']},
     call_button="Apply operation",
@@ -52,23 +67,35 @@ def binary_morphology_widget(
     method = "erosion",
     footprint = "disk",
     footprint_size = 3,
+    decompose: bool = True,
+    approximate_balls: bool = False,
+    distance_transform: bool = True,
+    preserve_labels: bool = False,
+    label_type: str = 'auto',
     #mode = "ignore"
 ) -> napari.types.LayerDataTuple:
     fun = getattr(sm, f'binary_{method}')
-    if footprint == 'cube':
-        selem = sm.footprint_rectangle((footprint_size, footprint_size, footprint_size))
-    else:
-        fun_footprint = getattr(sm, footprint)
-        selem = fun_footprint(footprint_size)
+    selem = get_footprint(footprint, footprint_size, decompose=decompose, binary=True,
+                          approximate=approximate_balls)
 
-    if (label_layer.data.ndim == 3) and (selem.ndim == 2):
+    if (label_layer.data.ndim == 3) and (footprint_ndim(selem) == 2):
         raise ValueError("For 3D data, selem needs to be 'ball")
-    if (label_layer.data.ndim == 2) and (selem.ndim == 3):
+    if (label_layer.data.ndim == 2) and (footprint_ndim(selem) == 3):
         raise ValueError("For 2D data, selem cannot be 'ball'")
 
-    mask = fun(label_layer.data, selem)#, mode=mode)
+    # the distance transform is exact and respects the voxel size of anisotropic layers
+    sampling = pixel_sampling(label_layer.scale[-footprint_ndim(selem):])
+    if preserve_labels:
+        if footprint not in ('disk', 'ball'):
+            raise ValueError("Preserving labels requires a 'disk' or 'ball' footprint")
+        mask = label_morphology(method, label_layer.data, footprint_size, sampling)
+    elif distance_transform and footprint in ('disk', 'ball') and (
+            footprint_size >= DISTANCE_TRANSFORM_RADIUS or sampling is not None):
+        mask = distance_morphology(method, label_layer.data, footprint_size, sampling)
+    else:
+        mask = fun(label_layer.data, selem)#, mode=mode)
     return (
-        mask,
+        as_labels(mask, dtype=label_type),
         {'name': f'{label_layer.name}_{method}'},
         'labels')
 
@@ -79,6 +106,8 @@ def binary_morphology_widget(
     footprint={'label': 'Footprint', 'choices': ['disk', 'square', 
                                                  'diamond', 'star', 'octagon', 'ball', 'cube']},
     footprint_size={'label': 'Footprint size', 'max': 100, 'min': 1, 'step': 1},
+    decompose={'label': 'Decompose large footprints'},
+    approximate_balls={'label': 'Approximate large balls (faster)'},
     # to add for skimage 0.23
     # mode = {'choices': ['reflect', 'constant', 'nearest0', 'mirror', 'wrap', 'max', 'min', 'ignore']},
     call_button="Apply operation",
@@ -89,18 +118,16 @@ def morphology_widget(
     method = "erosion",
     footprint = "disk",
     footprint_size = 3,
+    decompose: bool = True,
+    approximate_balls: bool = False,
     #mode = "ignore"
 ) -> napari.types.LayerDataTuple:
     fun = getattr(sm, f'{method}')
-    if footprint == 'cube':
-        selem = sm.footprint_rectangle((footprint_size, footprint_size, footprint_size))
-    else:
-        fun_footprint = getattr(sm, footprint)
-        selem = fun_footprint(footprint_size)
+    selem = get_footprint(footprint, footprint_size, decompose=decompose, approximate=approximate_balls)
 
-    if (label_layer.data.ndim == 3) and (selem.ndim == 2):
+    if (label_layer.data.ndim == 3) and (footprint_ndim(selem) == 2):
         raise ValueError("For 3D data, selem needs to be 'ball")
-    if (label_layer.data.ndim == 2) and (selem.ndim == 3):
+    if (label_layer.data.ndim == 2) and (footprint_ndim(selem) == 3):
         raise ValueError("For 2D data, selem cannot be 'ball'")
     
     mask = fun(label_layer.data, selem)#, mode=mode)
@@ -6,13 +6,17 @@ import numpy as np
 import pandas as pd
 from qtpy.QtWidgets import QFileDialog
 from magicgui import magic_factory
-from magicgui.widgets import Label, Table, Button
+from magicgui.widgets import Label, Button
 from napari.layers import Image, Labels
 from napari.utils.notifications import show_info, show_warning
 from qtpy.QtCore import Qt
-from skimage.measure import regionprops_table
 from skimage.measure._regionprops import PROPS, _require_intensity_image
 
+from ._label_edits import LabelEdits
+from ._regionprops import (compute_regionprops_table, label_centroid, label_index,
+                           update_regionprops_table)
+from ._table import ResultsTable
+
 if TYPE_CHECKING:
     from magicgui.widgets import Widget
 
@@ -32,6 +36,21 @@ only_2d_properties = {
 valid_properties_3d = available_properties - only_2d_properties
 
 
+def _center_on(viewer: napari.Viewer, layer: Labels, position: np.ndarray) -> None:
+    """Move the camera and the sliders of the viewer to a position in the data of layer."""
+    if viewer is None:
+        return
+    world = np.asarray(layer.data_to_world(position))
+    # layers are aligned to the last dimensions of the viewer
+    first = viewer.dims.ndim - len(world)
+    for axis in range(first, viewer.dims.ndim):
+        if axis not in viewer.dims.displayed:
+            viewer.dims.set_point(axis, world[axis - first])
+    displayed = [axis for axis in viewer.dims.displayed if axis >= first]
+    if len(displayed) == len(viewer.dims.displayed):
+        viewer.camera.center = tuple(world[axis - first] for axis in displayed)
+
+
 def _on_init(widget: "Widget") -> None:
     """Initialize the widget, add a hyperlink, and set up connections."""
     
@@ -91,15 +110,21 @@ def _on_init(widget: "Widget") -> None:
             widget.call_button.enabled = False
 
     def clicked_table(event: object):
-        row = widget.results_table.native.currentRow()
-        if "label" in widget.results_table.column_headers:
-            label = int(widget.results_table["label"][row])
-        else:
-            # If the label column is not present, use the row index
-            # plus one to account for zero-based indexing
-            label = np.unique(widget.labels_layer.value.data)[row+1]
+        # row of the results (not of the sorted or filtered table)
+        row = widget.results_table.current_row()
+        if row is None:
+            return
+        # labels and centroids of the rows are indexed once per analysis
+        index = widget._label_index
+        label = int(index["label"][row])
         show_info(f"Table clicked, set label: {label}")
-        widget.labels_layer.value.selected_label = label
+        labels_layer = widget.labels_layer.value
+        labels_layer.selected_label = label
+        if "centroid" in index:
+            centroid = index["centroid"][row]
+        else:
+            centroid = label_centroid(labels_layer.data, label, index["bbox"][row])
+        _center_on(napari.current_viewer(), labels_layer, centroid)
 
     def save_table(event: object):
         # get file path from user
@@ -114,20 +139,21 @@ def _on_init(widget: "Widget") -> None:
         if not file_path:
             return
 
-        widget.results_table.to_dataframe().to_csv(
+        # all results are saved, including the rows hidden by the filter
+        widget.results_table.value.to_csv(
                 file_path,
                 index=False,
             )
     
-    # initialize table
-    widget.results_table = Table(name="Results Table")
+    # initialize table, only rendering the visible rows (see _table)
+    widget.results_table = ResultsTable(name="Results Table")
 
     # Connect the signals to the update functions
     widget.labels_layer.changed.connect(update_properties_choices)
     widget.image_layer.changed.connect(update_properties_choices)
     widget.labels_layer.changed.connect(update_analyze_button_state)
     widget.image_layer.changed.connect(update_analyze_button_state)
-    widget.results_table.native.clicked.connect(clicked_table)
+    widget.results_table.view.clicked.connect(clicked_table)
     widget.save_button.clicked.connect(save_table)
 
     # initialize Select widget and button state
@@ -167,16 +193,45 @@ def regionprops_widget(
         image_layer_data = None
         spacing = None
 
-    # Compute regionprops_table
-    props = regionprops_table(
-        label_image=labels_layer.data,
-        intensity_image=image_layer_data,
-        properties=properties,
-        spacing=spacing,
-    )
+    # labels edited since the last analysis of the same layers and properties
+    edits = getattr(regionprops_widget, "_label_edits", None)
+    analysis = (labels_layer, image_layer, list(properties),
+                None if spacing is None else tuple(spacing))
+    if (
+        edits is not None
+        and edits.valid
+        and getattr(regionprops_widget, "_analysis", None) == analysis
+    ):
+        # only recompute the rows of the edited labels
+        results_df, regionprops_widget._label_index = update_regionprops_table(
+            regionprops_widget.results_table.value,
+            regionprops_widget._label_index,
+            labels_layer.data,
+            image_layer_data,
+            properties,
+            spacing,
+            edits.boxes,
+        )
+    else:
+        # Compute regionprops_table, in parallel for many labels (see _regionprops)
+        props = compute_regionprops_table(
+            label_image=labels_layer.data,
+            intensity_image=image_layer_data,
+            properties=properties,
+            spacing=spacing,
+        )
+
+        # Convert to DataFrame
+        results_df = pd.DataFrame(props)
 
-    # Convert to DataFrame
-    results_df = pd.DataFrame(props)
+        # rows of the table are in label order, indexed from its columns if possible
+        regionprops_widget._label_index = label_index(labels_layer.data, results_df, spacing)
+
+        if edits is not None:
+            edits.disconnect()
+        edits = regionprops_widget._label_edits = LabelEdits(labels_layer, image_layer)
+    edits.reset()
+    regionprops_widget._analysis = analysis
 
     # Enable save button
     regionprops_widget.save_button.enabled = True
@@ -188,8 +243,6 @@ def regionprops_widget(
         or regionprops_widget._results_dock_widget.widget is None
     ):
         regionprops_widget.results_table.value = results_df
-        regionprops_widget.results_table.read_only = True
-
         regionprops_widget._results_dock_widget = (
             viewer.window.add_dock_widget(
                 regionprops_widget.results_table,
@@ -200,13 +253,9 @@ def regionprops_widget(
     else:
         try:
             regionprops_widget.results_table.value = results_df
-            regionprops_widget.results_table.read_only = True
-
             regionprops_widget._results_dock_widget.show()
         except RuntimeError:
             regionprops_widget.results_table.value = results_df
-            regionprops_widget.results_table.read_only = True
-
             regionprops_widget._results_dock_widget = (
                 viewer.window.add_dock_widget(
                     regionprops_widget.results_table,
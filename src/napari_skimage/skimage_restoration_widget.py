@@ -1,4 +1,5 @@
-from typing import TYPE_CHECKING
+from functools import partial
+from typing import TYPE_CHECKING, Optional
 
 import numpy as np
 from magicgui import magic_factory
@@ -6,8 +7,12 @@ from magicgui.widgets import Label
 from qtpy.QtCore import Qt
 import skimage.restoration as sr
 from napari.layers import Image
+from napari.qt.threading import FunctionWorker
 import napari.types
 
+from ._execution import (PRECISION, PROCESS_AXIS, add_cancel_button, connect_axis_choices,
+                         run_in_worker, with_precision)
+
 
 if TYPE_CHECKING:
     import napari
@@ -16,10 +21,14 @@ if TYPE_CHECKING:
 In this module, widgets for restoration methods are defined one by one. The _on_init function that can be used
 with the widget_init argument of @magic_factory adds a hyperlink to the documentation of the function that the
 widget is calling. For this to work properly, the widget function needs to be named
-"<skimage function name>_restoration_widget".
+"<skimage function name>_restoration_widget". As for filters, the computation runs in a background thread
+and can be applied independently to each frame along an axis (see the _execution module). The precision
+of floating point results can be chosen, rolling_ball returning results of the input type.
 '''
 
 def _on_init(widget):
+    add_cancel_button(widget)
+    connect_axis_choices(widget[0], widget.process_axis)
     label_widget = Label(value='')   
     
     func_name = '_'.join(widget.label.split(' ')[0:-2])
@@ -31,19 +40,24 @@ def _on_init(widget):
 
 @magic_factory(
         image_layer={'label': 'Image'},
+        process_axis=PROCESS_AXIS,
         call_button="Apply rolling ball",
         widget_init=_on_init
         )
 def rolling_ball_restoration_widget(
     image_layer: Image, 
-    radius: int = 100) -> napari.types.LayerDataTuple:
-    return (
-        sr.rolling_ball(image_layer.data, radius=radius),
+    radius: int = 100,
+    process_axis: Optional[int] = None) -> FunctionWorker[napari.types.LayerDataTuple]:
+    return run_in_worker(
+        partial(sr.rolling_ball, radius=radius),
+        image_layer.data,
         {'name': f'{image_layer.name}_rolling_ball'},
-        'image')
+        axis=process_axis)
 
 @magic_factory(
         image_layer={'label': 'Image'},
+        precision=PRECISION,
+        process_axis=PROCESS_AXIS,
         call_button="Apply denoise nl means",
         widget_init=_on_init
         )
@@ -53,10 +67,14 @@ def denoise_nl_means_restoration_widget(
     h: float = 0.1,
     fast_mode: bool = True,
     sigma: float = 0.0,
-    preserve_range : bool = False) -> napari.types.LayerDataTuple:
-    return (
-        sr.denoise_nl_means(image_layer.data, patch_distance=patch_distance,
-                        h=h, fast_mode=fast_mode, sigma=sigma,
-                        preserve_range=preserve_range),
+    preserve_range : bool = False,
+    precision: str = 'auto',
+    process_axis: Optional[int] = None) -> FunctionWorker[napari.types.LayerDataTuple]:
+    return run_in_worker(
+        with_precision(partial(sr.denoise_nl_means, patch_distance=patch_distance,
+                               h=h, fast_mode=fast_mode, sigma=sigma,
+                               preserve_range=preserve_range),
+                       image_layer.data, precision, rescale=not preserve_range),
+        image_layer.data,
         {'name': f'{image_layer.name}_denoise_nl_means'},
-        'image')
\ No newline at end of file
+        axis=process_axis)
\ No newline at end of file
@@ -1,23 +1,46 @@
-from typing import TYPE_CHECKING
+from functools import partial
+from typing import TYPE_CHECKING, Optional
 
 from magicgui import magic_factory
-from magicgui.widgets import Label, Container, Button, create_widget
+import dask.array as da
+import numpy as np
+from magicgui.widgets import Label, Container, Button, CheckBox, create_widget
 from qtpy.QtCore import Qt
 import skimage.filters.thresholding as st
 from napari.layers import Image, Labels
+from napari.qt.threading import FunctionWorker
 import napari.types
 
+from ._execution import (PROCESS_AXIS, add_cancel_button, connect_axis_choices,
+                         run_in_worker)
+from ._histogram import histogram_threshold
+from ._labeling import LABEL_TYPE, as_labels
+from ._stats import request_statistics
+from ._tiling import as_dask, is_lazy
+
 
 if TYPE_CHECKING:
     import napari
 
 """
-For thresholding, a single widget is defined that can be used for all thresholding methods. No options are available.
+For thresholding, a single widget is defined that can be used for all thresholding methods. The threshold can be
+computed independently for each frame along an axis (e.g. time), in parallel. For lazy (dask, zarr) layers, global
+thresholds are computed from a histogram accumulated chunk by chunk, optionally on a fraction of the chunks only
+(see _histogram), and the mask is itself lazy. The local Sauvola threshold is applied tile by tile.
+In "tiles" mode, a threshold is computed for each tile of the image and the thresholds are interpolated linearly
+between the tile centers, which adapts global methods to uneven illumination. For lazy layers, the tile
+thresholds are computed in parallel by dask and the mask is interpolated lazily chunk by chunk. The thresholds (one per frame, or
+one grid per frame in tiles mode) are stored in the metadata of the output layer.
 Manual thresholding is handled via a Container class definition. The main reason for this is that the threshold value
-needs to be updated based on the image and more options (e.g. multi-threshold) can be added in the future.
+needs to be updated based on the image and more options (e.g. multi-threshold) can be added in the future. The range
+of the threshold is taken from the cached statistics of the layer (see _stats), computed in the background.
+In "Live" mode, the mask is shown as a lazy overlay, only computed for the displayed slice each time the threshold
+changes. The full mask is only computed when applying the threshold.
 """
 
 def _on_init(widget):
+    add_cancel_button(widget)
+    connect_axis_choices(widget[0], widget.process_axis)
     label_widget = Label(value='')   
     
     func_name = widget.method.value
@@ -32,20 +55,100 @@ def _on_init(widget):
 @magic_factory(
         img_layer={'label': 'Image'},
         method={'choices': ['otsu', 'li', 'mean', 'yen', 'sauvola']},
+        sampled_fraction={'label': 'Fraction of chunks (lazy data)', 'min': 0.01, 'max': 1.0, 'step': 0.05},
+        mode={'choices': ['global', 'tiles']},
+        tile_size={'label': 'Tile size', 'min': 8, 'max': 4096},
+        process_axis=PROCESS_AXIS,
+        label_type=LABEL_TYPE,
         call_button="Apply Thresholding",
         widget_init=_on_init
         )
 def threshold_widget(
     img_layer: Image,
     method = "otsu",
-) -> napari.types.LayerDataTuple:
-    fun = getattr(st, f'threshold_{method}')
-    th = fun(img_layer.data)
-    mask = img_layer.data > th
-    return (
-        mask,
+    sampled_fraction: float = 1.0,
+    mode: str = 'global',
+    tile_size: int = 64,
+    process_axis: Optional[int] = None,
+    label_type: str = 'auto',
+) -> FunctionWorker[napari.types.LayerDataTuple]:
+    return run_in_worker(
+        partial(_threshold_mask, method=method, sampled_fraction=sampled_fraction,
+                mode=mode, tile_size=tile_size, label_type=label_type),
+        img_layer.data,
         {'name': f'{img_layer.name}_threshold_{method}'},
-        'labels')
+        layer_type='labels',
+        # the local threshold only needs a halo of half the default window size (15)
+        depth=7 if method == 'sauvola' else None,
+        axis=process_axis,
+        # the local threshold is a full image, not worth storing
+        metadata_key=None if method == 'sauvola' else 'threshold')
+
+
+def _lazy_mask(data, threshold):
+    """Mask of data above threshold computed on demand, plane by plane for in-memory data."""
+    if not isinstance(data, da.Array):
+        chunks = getattr(data, 'chunks', (1,) * (data.ndim - 2) + data.shape[-2:])
+        data = da.from_array(data, chunks=chunks)
+    return data > threshold
+
+
+def tile_thresholds(data, method, tile_size):
+    """Threshold of each tile of size tile_size along all axes of data."""
+    fun = getattr(st, f'threshold_{method}')
+    if is_lazy(data):
+        # one block per tile, thresholded in parallel
+        tiles = as_dask(data).rechunk(tile_size)
+        return tiles.map_blocks(lambda tile: np.full((1,) * tile.ndim, fun(tile)),
+                                chunks=(1,) * tiles.ndim, dtype=float).compute()
+    grid = tuple(-(-s // tile_size) for s in data.shape)
+    thresholds = np.empty(grid)
+    for index in np.ndindex(grid):
+        thresholds[index] = fun(data[tuple(slice(i * tile_size, (i + 1) * tile_size) for i in index)])
+    return thresholds
+
+
+def interpolate_thresholds(thresholds, shape, tile_size, start=None):
+    """Threshold map of the given shape, interpolated linearly between tile centers.
+
+    If start is given, the map is that of a region of the given shape starting at start.
+    """
+    out = thresholds
+    for axis, size in enumerate(shape):
+        # position of each pixel in units of tiles, relative to the first tile center
+        offset = 0 if start is None else start[axis]
+        position = (np.arange(offset, offset + size) + 0.5) / tile_size - 0.5
+        low = np.clip(np.floor(position).astype(int), 0, thresholds.shape[axis] - 1)
+        high = np.minimum(low + 1, thresholds.shape[axis] - 1)
+        weight = np.clip(position - low, 0, 1).reshape((-1,) + (1,) * (len(shape) - axis - 1))
+        out = (1 - weight) * out.take(low, axis=axis) + weight * out.take(high, axis=axis)
+    return out
+
+
+def _interpolated_mask(block, thresholds, tile_size, block_info=None):
+    start = [location[0] for location in block_info[0]['array-location']]
+    return block > interpolate_thresholds(thresholds, block.shape, tile_size, start)
+
+
+def _threshold_mask(data, method, sampled_fraction=1.0, mode='global', tile_size=64, label_type='auto'):
+    """Mask of data above its threshold, returned with the threshold(s) except for sauvola."""
+    if method == 'sauvola':
+        return as_labels(data > st.threshold_sauvola(data), dtype=label_type)
+    if mode == 'tiles':
+        th = tile_thresholds(data, method, tile_size)
+        if is_lazy(data):
+            mask = as_dask(data).map_blocks(
+                partial(_interpolated_mask, thresholds=th, tile_size=tile_size), dtype=bool)
+        else:
+            mask = data > interpolate_thresholds(th, data.shape, tile_size)
+    elif is_lazy(data):
+        data = as_dask(data)
+        th = histogram_threshold(data, method, fraction=sampled_fraction)
+        mask = data > th
+    else:
+        th = getattr(st, f'threshold_{method}')(data)
+        mask = data > th
+    return as_labels(mask, dtype=label_type), np.asarray(th, dtype=float)
 
 
 class ManualThresholdWidget(Container):
@@ -62,6 +165,14 @@ class ManualThresholdWidget(Container):
             options={'value': 0, 'min': 0, 'max': 255, 'step': 1}
         )
 
+        self.label_type = create_widget(
+            label=LABEL_TYPE['label'], annotation=str, widget_type='ComboBox',
+            options={'choices': LABEL_TYPE['choices']}
+        )
+
+        self.live = CheckBox(text='Live', value=False)
+        self._live_layer = None
+
         self.btn_apply = Button(text="Apply Thresholding")
         self.btn_apply.clicked.connect(self.apply_threshold)
 
@@ -70,6 +181,8 @@ class ManualThresholdWidget(Container):
             [
                 self._image_layer_combo,
                 self.threshold,
+                self.label_type,
+                self.live,
                 self.btn_apply,
             ]
         )
@@ -77,24 +190,53 @@ class ManualThresholdWidget(Container):
         self._image_layer_combo.changed.connect(self._on_update_threshold_limits)
         self._on_update_threshold_limits(self)
 
+        for widget in [self._image_layer_combo, self.threshold, self.live]:
+            widget.changed.connect(self._update_live_mask)
+
     def _on_update_threshold_limits(self, event=None):
         image_layer = self._image_layer_combo.value
         if image_layer is None:
             return
-        if (self.threshold.value > image_layer.data.max()) or (self.threshold.value < image_layer.data.min()):
-            self.threshold.value = image_layer.data.min()
+        request_statistics(image_layer, partial(self._set_threshold_limits, image_layer))
+
+    def _set_threshold_limits(self, image_layer, statistics):
+        if image_layer is not self._image_layer_combo.value:
+            return
+        if (self.threshold.value > statistics.max) or (self.threshold.value < statistics.min):
+            self.threshold.value = statistics.min
         # setting the minimum creates the following problem. If the mimimum
         # is set to 7 and one wants to input 100, starting to type 1 turns it
         # automatically to 7. Leaving at 0 for the moment
-        # self.threshold.min = image_layer.data.min()
-        self.threshold.max = image_layer.data.max()
+        # self.threshold.min = statistics.min
+        self.threshold.max = statistics.max
         self.threshold.step = (self.threshold.max - self.threshold.min) / 100
 
+    def _update_live_mask(self, event=None):
+        image_layer = self._image_layer_combo.value
+        if not self.live.value or image_layer is None:
+            self._remove_live_mask()
+            return
+        mask = _lazy_mask(image_layer.data, self.threshold.value)
+        name = f"{image_layer.name}_threshold_live"
+        if self._live_layer in self._viewer.layers and self._live_layer.name == name:
+            self._live_layer.data = mask
+        else:
+            self._remove_live_mask()
+            self._live_layer = self._viewer.add_labels(
+                mask, name=name, scale=image_layer.scale, translate=image_layer.translate, opacity=0.5)
+
+    def _remove_live_mask(self):
+        if self._live_layer in self._viewer.layers:
+            self._viewer.layers.remove(self._live_layer)
+        self._live_layer = None
+
     def apply_threshold(self, event=None):
         image_layer = self._image_layer_combo.value
         if image_layer is None:
             return
-        mask = image_layer.data > self.threshold.value
+        # the live overlay is replaced by the full mask
+        self.live.value = False
+        mask = as_labels(image_layer.data > self.threshold.value, dtype=self.label_type.value)
         self._viewer.add_labels(
             mask,
             name=f"{image_layer.name}_threshold_manual",